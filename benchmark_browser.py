@@ -0,0 +1,220 @@
+"""Page load time and bytes transferred with the default and the light Firefox profile
+
+Usage: python benchmark_browser.py [URL ...] [--pages N] [--repeat N] [--json]
+       python benchmark_browser.py [URL ...] --memory N [--light]
+
+Without URLs it loads the issuer listing and the first N issuer detail
+pages (CMF_BASE_URL is honoured, so fixture_server.py works too). Each page
+is loaded in a fresh driver per mode, cold; the load time is the wall time
+of driver.get(), which returns at the 'load' event with the default profile
+and at DOMContentLoaded with the eager light one. Bytes are the
+transferSize sum of the Navigation and Resource Timing entries, so blocked
+hosts and skipped images simply do not show up; cross-origin resources
+without Timing-Allow-Origin report 0 bytes and are only counted.
+
+--memory N compares N concurrent issuers held as N Firefox processes (one
+per worker, DRIVER_POOL) with N tabs of one Firefox (TAB_POOL, --tabs):
+once every page is loaded it sums the PSS of geckodriver and all its
+descendants from /proc, so it only runs on Linux.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+import urllib.parse
+from selenium import webdriver
+from browser_profile import firefox_options
+from http_engine import BASE_URL, LISTING_URL, CMF_HTTP_ENGINE
+from tab_pool import TAB_POOL, TABBED_FIREFOX
+
+TRANSFER_SCRIPT = """
+var entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+var bytes = 0;
+for (var i = 0; i < entries.length; i++) { bytes += entries[i].transferSize || 0; }
+return [bytes, entries.length];
+"""
+MODES = ('default', 'light')
+
+
+def default_urls(pages):
+    links = CMF_HTTP_ENGINE().get_listing_links('NV') or []
+    return [LISTING_URL] + [urllib.parse.urljoin(BASE_URL, link) for link in links[:pages]]
+
+
+def load(driver, url):
+    start = time.perf_counter()
+    driver.get(url)
+    seconds = time.perf_counter() - start
+    transferred, requests = driver.execute_script(TRANSFER_SCRIPT)
+    return {'seconds': seconds, 'bytes': transferred, 'requests': requests}
+
+
+def measure(mode, urls, repeat):
+    samples = {url: [] for url in urls}
+    for _ in range(repeat):
+        for url in urls:
+            # Un driver nuevo por carga: sin caché ni conexiones abiertas de la página anterior
+            driver = webdriver.Firefox(options=firefox_options(light=mode == 'light'))
+            driver.set_page_load_timeout(60)
+            try:
+                samples[url].append(load(driver, url))
+            except Exception as e:
+                print(f"  {mode}: {url}: {e}")
+            finally:
+                driver.quit()
+    return samples
+
+
+def summary(samples):
+    pages = [s for runs in samples.values() for s in runs]
+    if not pages:
+        return None
+    return {
+        'pages': len(pages),
+        'median_seconds': statistics.median(p['seconds'] for p in pages),
+        'total_seconds': sum(p['seconds'] for p in pages),
+        'median_bytes': statistics.median(p['bytes'] for p in pages),
+        'total_bytes': sum(p['bytes'] for p in pages),
+        'requests': sum(p['requests'] for p in pages),
+    }
+
+
+def process_memory(pid):
+    """PSS in bytes of `pid` and its descendants (RSS where smaps_rollup is missing)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # El nombre del proceso va entre paréntesis y puede tener espacios
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        for path, field in ((f'/proc/{current}/smaps_rollup', 'Pss:'), (f'/proc/{current}/status', 'VmRSS:')):
+            try:
+                with open(path) as f:
+                    line = next((line for line in f if line.startswith(field)), None)
+            except OSError:
+                continue
+            if line is not None:
+                total += int(line.split()[1]) * 1024
+                break
+    return total
+
+
+def memory_per_driver(urls, light):
+    drivers = []
+    try:
+        for url in urls:
+            driver = webdriver.Firefox(options=firefox_options(light=light))
+            drivers.append(driver)
+            driver.get(url)
+        return sum(process_memory(driver.service.process.pid) for driver in drivers)
+    finally:
+        for driver in drivers:
+            driver.quit()
+
+
+def memory_per_tab(urls, light):
+    pool = TAB_POOL(lambda: TABBED_FIREFOX(options=firefox_options(light=light, page_load_strategy='none')),
+                    max_size=len(urls))
+    loaded = threading.Barrier(len(urls) + 1)
+    measured = threading.Event()
+
+    def hold(url):
+        try:
+            with pool.lease() as driver:
+                driver.get(url)
+                loaded.wait()
+                measured.wait()
+        except threading.BrokenBarrierError:
+            pass
+        except Exception as e:
+            print(f"  tab: {url}: {e}")
+            loaded.abort()
+
+    threads = [threading.Thread(target=hold, args=(url,)) for url in urls]
+    for thread in threads:
+        thread.start()
+    try:
+        loaded.wait()
+        return process_memory(pool.browser.service.process.pid)
+    finally:
+        measured.set()
+        for thread in threads:
+            thread.join()
+        pool.close()
+
+
+def compare_memory(urls, count, light):
+    urls = [urls[i % len(urls)] for i in range(count)]
+    results = {'concurrent': count, 'drivers_bytes': memory_per_driver(urls, light),
+               'tabs_bytes': memory_per_tab(urls, light)}
+    print(f"{count} issuers at once, {'light' if light else 'default'} profile")
+    for name, key in ((f"{count} browsers", 'drivers_bytes'), (f"1 browser, {count} tabs", 'tabs_bytes')):
+        print(f"  {name:<20} {results[key] / 2 ** 20:8.0f} MB  {results[key] / count / 2 ** 20:6.0f} MB per issuer")
+    print(f"  x{results['drivers_bytes'] / results['tabs_bytes']:.1f} less memory with tabs")
+    return results
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('urls', nargs='*', help='pages to load (default: listing plus issuer detail pages)')
+    arg_parser.add_argument('--pages', type=int, default=5, help='issuer detail pages to load without URLs')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    arg_parser.add_argument('--memory', type=int, metavar='N', help='compare memory of N browsers with N tabs instead')
+    arg_parser.add_argument('--light', action='store_true', help='use the light profile in --memory')
+    args = arg_parser.parse_args(argv)
+
+    urls = args.urls or default_urls(args.pages)
+    if args.memory:
+        compare_memory(urls, args.memory, args.light)
+        return 0
+    results = {}
+    for mode in MODES:
+        samples = measure(mode, urls, args.repeat)
+        results[mode] = {'pages': samples, 'summary': summary(samples)}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    for url in urls:
+        print(f"\n{url}")
+        for mode in MODES:
+            runs = results[mode]['pages'][url]
+            if not runs:
+                print(f"  {mode:<8} failed")
+                continue
+            seconds = statistics.median(r['seconds'] for r in runs)
+            transferred = statistics.median(r['bytes'] for r in runs)
+            requests = statistics.median(r['requests'] for r in runs)
+            print(f"  {mode:<8} {seconds * 1000:9.0f} ms  {transferred / 1024:9.0f} KB  {requests:5.0f} requests")
+
+    print("\nTotal")
+    base = results['default']['summary']
+    for mode in MODES:
+        s = results[mode]['summary']
+        if s is None:
+            print(f"  {mode:<8} no page loaded")
+            continue
+        line = (f"  {mode:<8} median {s['median_seconds'] * 1000:7.0f} ms  {s['median_bytes'] / 1024:7.0f} KB  "
+                f"total {s['total_seconds']:7.2f} s  {s['total_bytes'] / 1024:9.0f} KB  {s['requests']} requests")
+        if base is not None and mode != 'default' and s['total_seconds'] and s['total_bytes']:
+            line += (f"  x{base['total_seconds'] / s['total_seconds']:4.1f} faster, "
+                     f"x{base['total_bytes'] / s['total_bytes']:4.1f} fewer bytes")
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
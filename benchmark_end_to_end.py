@@ -0,0 +1,155 @@
+"""End-to-end throughput benchmark of the crawl entry points against fixture_server.py
+
+Usage: python benchmark_end_to_end.py [--scenario scraper|detector|crawl|both] [--workers N] [--json results.json]
+       plus any fixture_server.py option (--companies, --latency, --page-kb, ...)
+
+Each scenario runs the real script's CLI in a subprocess, pointing it at a
+local fixture server through CMF_BASE_URL, in a fresh output directory.
+With --shards N the scenario runs as N concurrent --shard processes whose
+outputs are then merged with sharding.py. Reported per scenario: wall time, companies/minute,
+PDFs/minute, redirections found, per-route server latency percentiles and
+the peak RSS of the script's own Python processes (browser processes are
+not included). 'crawl' is the combined crawl_all.py pass that writes the
+outputs of both scripts at once.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from fixture_server import add_fixture_arguments, fixture_from_args, start_server
+from sharding import merge_shards
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = {
+    'scraper': 'scrape_financial_information_by_daterange_v5.py',
+    'detector': 'financial_information_redirection.py',
+    'crawl': 'crawl_all.py',
+}
+
+
+def script_args(scenario, out_dir, args):
+    argv = [sys.executable, os.path.join(HERE, SCRIPTS[scenario]), out_dir, '--workers', str(args.workers)]
+    if scenario != 'detector':
+        argv += ['--start', args.start, '--end', args.end]
+    return argv
+
+
+def count_csv_rows(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+
+def count_pdfs(out_dir):
+    total = 0
+    for _, dirs, files in os.walk(out_dir):
+        # Los PDF de cada shard ya están enlazados en out_dir al fusionar
+        dirs[:] = [name for name in dirs if not name.startswith('shard-')]
+        total += sum(1 for name in files if name.endswith('.pdf'))
+    return total
+
+
+def run_scenario(scenario, args):
+    fixture = fixture_from_args(args)
+    server, base_url = start_server(fixture)
+    out_dir = tempfile.mkdtemp(prefix=f"cmf_bench_{scenario}_")
+    log_path = os.path.join(out_dir, 'stdout.log')
+    env = dict(os.environ, CMF_BASE_URL=base_url, PYTHONUNBUFFERED='1')
+    shards = [None] if args.shards == 1 else [f"{i}/{args.shards}" for i in range(args.shards)]
+    try:
+        with open(log_path, 'w', encoding='utf-8') as log:
+            start = time.perf_counter()
+            processes = {}
+            for shard in shards:
+                argv = script_args(scenario, out_dir, args) + (['--shard', shard] if shard else [])
+                process = subprocess.Popen(argv, cwd=HERE, env=env, stdin=subprocess.DEVNULL,
+                                           stdout=log, stderr=subprocess.STDOUT, text=True)
+                processes[process.pid] = process
+            # wait4 da el uso de recursos de cada proceso hijo en particular
+            exit_code, peak_rss, cpu_seconds = 0, 0, 0.0
+            for pid in processes:
+                _, status, usage = os.wait4(pid, 0)
+                exit_code = exit_code or os.waitstatus_to_exitcode(status)
+                peak_rss = max(peak_rss, usage.ru_maxrss)
+                cpu_seconds += usage.ru_utime + usage.ru_stime
+            if shards != [None]:
+                merge_shards(out_dir)
+            seconds = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+        log_text = f.read()
+    if scenario == 'detector':
+        companies = log_text.count('Analizando:')
+    else:
+        companies = count_csv_rows(os.path.join(out_dir, 'Output.csv'))
+    pdfs = count_pdfs(out_dir)
+    redirections = count_csv_rows(os.path.join(out_dir, 'redirections.csv'))
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak_rss_mb = peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    result = {
+        'scenario': scenario,
+        'shards': args.shards,
+        'exit_code': exit_code,
+        'seconds': seconds,
+        'companies': companies,
+        'companies_per_min': companies * 60 / seconds if seconds else 0.0,
+        'pdfs': pdfs,
+        'pdfs_per_min': pdfs * 60 / seconds if seconds else 0.0,
+        'redirections': redirections,
+        'peak_rss_mb': peak_rss_mb,
+        'cpu_seconds': cpu_seconds,
+        'output_dir': out_dir,
+    }
+    result.update(fixture.summary())
+    if not args.keep_output:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    elif result['exit_code'] != 0:
+        print(f"{scenario} exited with {result['exit_code']}; see {log_path}")
+    return result
+
+
+def print_result(result):
+    print(f"\n{result['scenario']} (exit {result['exit_code']}): {result['seconds']:.1f} s wall, "
+          f"{result['cpu_seconds']:.1f} s CPU, peak RSS {result['peak_rss_mb']:.0f} MB")
+    print(f"  {result['companies']} companies ({result['companies_per_min']:.1f}/min), "
+          f"{result['pdfs']} PDFs ({result['pdfs_per_min']:.1f}/min), {result['redirections']} redirections")
+    print(f"  server sent {result['bytes_sent'] / (1024 * 1024):.1f} MB")
+    for route, stats in result['routes'].items():
+        print(f"  {route:<9} {stats['requests']:6d} requests  p50 {stats['p50_ms']:7.1f} ms  "
+              f"p90 {stats['p90_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--scenario', choices=['scraper', 'detector', 'crawl', 'both'], default='scraper')
+    arg_parser.add_argument('--workers', type=int, default=1)
+    arg_parser.add_argument('--start', default='2015-1-1', help='scraper/crawl start date')
+    arg_parser.add_argument('--end', default='2024-12-31', help='scraper/crawl end date')
+    arg_parser.add_argument('--shards', type=int, default=1, help='run each scenario as N concurrent shards and merge them')
+    arg_parser.add_argument('--json', help='also write the results to this file, for comparing runs')
+    arg_parser.add_argument('--keep-output', action='store_true', help='keep the output directories and logs')
+    add_fixture_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+
+    scenarios = ['scraper', 'detector'] if args.scenario == 'both' else [args.scenario]
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(scenario, args)
+        print_result(result)
+        results.append(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'arguments': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
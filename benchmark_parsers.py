@@ -0,0 +1,72 @@
+"""Micro-benchmark of the HTML parser backends on saved CMF pages
+
+Usage: python benchmark_parsers.py <directory with saved .html pages> [--repeat N]
+
+Compares the original approach (BeautifulSoup/html.parser over the full
+document, then findChildren('table')[0]) with html_parsing.table_rows() on
+each available backend. Peak memory is measured with tracemalloc, so it only
+counts allocations made through the Python allocator; the C trees built by
+lxml and selectolax are partly invisible to it.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import tracemalloc
+from bs4 import BeautifulSoup
+from html_parsing import available_backends, table_rows
+
+
+def full_document_bs4(html):
+    soup = BeautifulSoup(html, "html.parser")
+    table = soup.findChildren('table')[0]
+    return [[td.getText() for td in tr.findChildren('td')] for tr in table.findChildren('tr')]
+
+
+def measure(func, html, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(html)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('pages', help='directory with saved .html pages')
+    arg_parser.add_argument('--repeat', type=int, default=20)
+    args = arg_parser.parse_args(argv)
+
+    candidates = {'bs4 full document': full_document_bs4}
+    for backend in available_backends():
+        candidates[f"table_rows[{backend}]"] = lambda html, backend=backend: table_rows(html, backend=backend)
+
+    pages = sorted(f for f in os.listdir(args.pages) if f.endswith('.html'))
+    if not pages:
+        sys.exit(f"No .html pages found in {args.pages}")
+
+    totals = {name: [0.0, 0] for name in candidates}
+    for page in pages:
+        with open(os.path.join(args.pages, page), 'r', encoding='utf-8', errors='replace') as f:
+            html = f.read()
+        print(f"\n{page} ({len(html) / 1024:.0f} KB)")
+        for name, func in candidates.items():
+            seconds, peak = measure(func, html, args.repeat)
+            totals[name][0] += seconds
+            totals[name][1] = max(totals[name][1], peak)
+            print(f"  {name:<24} {seconds * 1000:9.2f} ms  peak {peak / 1024:9.0f} KB")
+
+    baseline = totals['bs4 full document'][0]
+    print("\nTotal")
+    for name, (seconds, peak) in totals.items():
+        print(f"  {name:<24} {seconds * 1000:9.2f} ms  x{baseline / seconds:5.1f}  max peak {peak / 1024:9.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
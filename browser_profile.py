@@ -0,0 +1,70 @@
+import json
+import urllib.parse
+from selenium.webdriver.firefox.options import Options
+
+# Hosts de terceros que cmfchile.cl carga en cada página: analítica, tag managers, fuentes, redes sociales
+# (no los CDN de librerías JS como jQuery: los handlers de Estado, aa y arriba dependen de ellas)
+BLOCKED_HOSTS = (
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'googleadservices.com', 'fonts.googleapis.com', 'fonts.gstatic.com',
+    'connect.facebook.net', 'facebook.com', 'platform.twitter.com', 'twitter.com', 'youtube.com',
+    'ytimg.com', 'addthis.com', 'sharethis.com', 'hotjar.com', 'newrelic.com', 'nr-data.net',
+    'clarity.ms', 'use.fontawesome.com', 'kit.fontawesome.com',
+)
+
+# Preferencias del perfil liviano: sin imágenes, medios, fuentes descargables ni prefetch
+LIGHT_PREFS = {
+    'permissions.default.image': 2,
+    'media.autoplay.default': 5,
+    'media.autoplay.blocking_policy': 2,
+    'media.mediasource.enabled': False,
+    'media.hls.enabled': False,
+    'media.webm.enabled': False,
+    'media.mp4.enabled': False,
+    'browser.display.use_document_fonts': 0,
+    'gfx.downloadable_fonts.enabled': False,
+    'network.prefetch-next': False,
+    'network.dns.disablePrefetch': True,
+    'network.http.speculative-parallel-limit': 0,
+    'browser.sessionhistory.max_total_viewers': 0,
+    'dom.webnotifications.enabled': False,
+    'geo.enabled': False,
+}
+
+
+def blocklist_pac(hosts):
+    """PAC script sending `hosts` and their subdomains to a closed local port, everything else direct"""
+    return ("function FindProxyForURL(url, host) {\n"
+            f"  var blocked = {json.dumps(list(hosts))};\n"
+            "  for (var i = 0; i < blocked.length; i++) {\n"
+            "    if (host == blocked[i] || dnsDomainIs(host, '.' + blocked[i])) return 'PROXY 127.0.0.1:9';\n"
+            "  }\n"
+            "  return 'DIRECT';\n"
+            "}\n")
+
+
+def firefox_options(light=False, blocked_hosts=BLOCKED_HOSTS, page_load_strategy=None):
+    """New Options for each driver, so repeated starts never stack arguments
+
+    light=True switches to the tuned profile: eager page loads (return at
+    DOMContentLoaded; the scrapers wait for their own elements anyway), no
+    images, media or web fonts, and third-party asset/analytics hosts
+    blocked through a PAC script. External portals still load, since only
+    the listed hosts are blocked. page_load_strategy overrides the strategy
+    of either profile ('none' for TABBED_FIREFOX).
+    """
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    if light:
+        options.page_load_strategy = 'eager'
+        for name, value in LIGHT_PREFS.items():
+            options.set_preference(name, value)
+        if blocked_hosts:
+            options.set_preference('network.proxy.type', 2)
+            options.set_preference('network.proxy.autoconfig_url',
+                                   'data:application/x-ns-proxy-autoconfig,' + urllib.parse.quote(blocklist_pac(blocked_hosts)))
+    if page_load_strategy:
+        options.page_load_strategy = page_load_strategy
+    return options
@@ -0,0 +1,96 @@
+import unicodedata
+from html_parsing import table_rows
+
+# Esquema de la tabla de detalle del emisor:
+# (columna de Output.csv, etiquetas que la identifican, fila usada cuando la tabla no trae etiquetas)
+# Las etiquetas van de la propia a los alias más sueltos, que solo se usan si falta la propia
+COMPANY_FIELDS = [
+    ('RUT', ['rut'], 0),
+    ('Business_Name', ['razon social'], 1),
+    ('Fantasy_Name', ['nombre de fantasia', 'fantasia'], 2),
+    ('Validity', ['vigencia', 'estado'], 3),
+    ('Registration_Num', ['numero de inscripcion', 'n de inscripcion', 'nro de inscripcion', 'numero inscripcion'], 4),
+    ('Enrollment_Date', ['fecha de inscripcion', 'fecha inscripcion'], 5),
+    ('Cancel_Date', ['fecha de cancelacion', 'fecha cancelacion'], 6),
+    ('Enrollment', ['inscripcion'], 7),
+    ('Telephone', ['telefono'], 8),
+    ('Fax', ['fax'], 9),
+    ('Address', ['domicilio', 'direccion'], 10),
+    ('Region', ['region'], 11),
+    ('Town', ['ciudad'], 12),
+    ('Commune', ['comuna'], 13),
+    ('Email', ['e-mail', 'email', 'correo'], 14),
+    ('Website', ['sitio web', 'pagina web', 'web'], 16),
+    ('Postal_Code', ['codigo postal'], 17),
+    ('Stock_Exchange_Name', ['nombre en bolsa', 'bolsa', 'nemotecnico'], 18),
+]
+
+OUTPUT_COLUMNS = [column for column, _, _ in COMPANY_FIELDS]
+
+# El más específico primero, para que "fecha de inscripcion" no caiga en "inscripcion"
+LABEL_KEYWORDS = sorted(((keyword, column, rank) for column, keywords, _ in COMPANY_FIELDS
+                         for rank, keyword in enumerate(keywords)), key=lambda entry: -len(entry[0]))
+
+# Pares [etiqueta, valor] de la primera tabla, en una sola llamada al navegador
+DETAIL_PAIRS_JS = """
+var table = document.querySelector('table');
+if (!table) { return null; }
+return Array.prototype.map.call(table.querySelectorAll('tr'), function (tr) {
+    var th = tr.querySelector('th'), td = tr.querySelector('td');
+    return [th ? th.textContent : '', td ? td.textContent : null];
+});
+"""
+
+
+def normalize_label(label):
+    # "N° / Nº" antes de NFKD, que convierte "º" en "o"
+    for c in ':°º':
+        label = label.replace(c, ' ')
+    label = unicodedata.normalize('NFKD', label)
+    label = ''.join(c for c in label if not unicodedata.combining(c))
+    return ' '.join(label.lower().replace('.', '').split())
+
+
+def column_for_label(label):
+    """(column, rank of the matching label in its COMPANY_FIELDS list), or (None, None)"""
+    label = normalize_label(label)
+    for keyword, column, rank in LABEL_KEYWORDS:
+        if keyword in label:
+            return column, rank
+    return None, None
+
+
+def pairs_from_html(html):
+    """[label, value] pairs of the first table, the same shape DETAIL_PAIRS_JS returns"""
+    pairs = []
+    for row in table_rows(html):
+        th = [c['text'] for c in row if c['tag'] == 'th']
+        td = [c['text'] for c in row if c['tag'] == 'td']
+        pairs.append([th[0] if th else '', td[0] if td else None])
+    return pairs
+
+
+def company_record(pairs):
+    """Map detail-table pairs to {Output.csv column: value}
+
+    Fields are matched by their row label, so they stay correct if CMF
+    reorders rows; when several rows match a column, the most specific
+    label wins over looser aliases (a "Vigencia" row over an "Estado" one),
+    whatever their order. Pages without labels fall back to the historical
+    row positions. Values are kept unstripped, as getText() returned them.
+    """
+    record = {column: '' for column in OUTPUT_COLUMNS}
+    if any(label.strip() for label, _ in pairs):
+        ranks = {}
+        for label, value in pairs:
+            column, rank = column_for_label(label)
+            if column is None or value is None:
+                continue
+            if column not in ranks or rank < ranks[column] or (rank == ranks[column] and not record[column]):
+                record[column] = value
+                ranks[column] = rank
+    else:
+        for column, _, row in COMPANY_FIELDS:
+            if row < len(pairs) and pairs[row][1] is not None:
+                record[column] = pairs[row][1]
+    return record
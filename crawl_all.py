@@ -0,0 +1,59 @@
+"""Output.csv, Memoria Anual PDFs and redirections.csv from one visit per issuer
+
+Usage: python crawl_all.py DIRECTORY --start 2015-1-1 --end 2024-12-31 [--workers N] [--estado NV|VI|both] [--shard i/N]
+       [--light-browser] [--tabs]
+"""
+import os
+import sys
+import argparse
+from download_manifest import DOWNLOAD_MANIFEST
+from state_journal import STATE_JOURNAL
+from date_planner import DATE_RANGE_PLANNER
+from crawl_pipeline import CRAWL_PIPELINE, add_crawl_arguments, estados_from_args
+from crawl_sinks import COMPANY_CSV_SINK, PDF_SINK, REDIRECTION_SINK
+from sharding import shard_directory
+
+class CMF_FULL_CRAWL:
+    """Both scripts' outputs in a single pass; call main() to run it"""
+    def __init__(self, directory, start, end, workers=1, estados=('NV',), shard=None, light_browser=False,
+                 tabs=False):
+        self.Dir = shard_directory(directory, shard)
+        self.start = start
+        self.end = end
+        self.workers = workers
+        self.estados = estados
+        self.shard = shard
+        self.light_browser = light_browser
+        self.tabs = tabs
+
+        os.makedirs(self.Dir, exist_ok=True)
+
+        self.journal = STATE_JOURNAL(os.path.join(self.Dir, 'crawl_progress'),
+                                     sets=('processed_ruts', 'downloaded_links', 'finished_links'),
+                                     maps=('filing_digests',))
+        self.log_file = os.path.join(self.Dir, 'download_log.txt')
+        self.manifest = DOWNLOAD_MANIFEST(os.path.join(self.Dir, 'download_manifest.jsonl'), self.log_file)
+
+    def main(self):
+        pipeline = CRAWL_PIPELINE(self.Dir, self.journal, workers=self.workers, estados=self.estados, shard=self.shard,
+                                  light_browser=self.light_browser, tabs=self.tabs)
+        date_range = DATE_RANGE_PLANNER(self.start, self.end)
+        pipeline.run([
+            COMPANY_CSV_SINK(pipeline, os.path.join(self.Dir, 'Output.csv')),
+            PDF_SINK(pipeline, date_range, self.manifest, self.log_file),
+            REDIRECTION_SINK(pipeline, os.path.join(self.Dir, 'redirections.csv')),
+        ])
+        self.journal.close()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_crawl_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+    CMF_FULL_CRAWL(args.directory, args.start, args.end, workers=args.workers,
+                   estados=estados_from_args(args), shard=args.shard, light_browser=args.light_browser,
+                   tabs=args.tabs).main()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,491 @@
+import os
+import time
+import argparse
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from dateutil import parser
+from selenium import webdriver
+from selenium.webdriver.support.ui import Select
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+from driver_pool import DRIVER_POOL
+from tab_pool import TAB_POOL, TABBED_FIREFOX
+from browser_profile import firefox_options
+from http_engine import BASE_URL, LISTING_URL, CMF_HTTP_ENGINE, parse_listing_links, select_options
+from company_fields import DETAIL_PAIRS_JS, company_record, pairs_from_html
+from page_cache import PAGE_CACHE
+from metrics import METRICS_REGISTRY
+from tracing import tracer_from_env
+from sharding import in_shard, parse_shard
+from rate_controller import HOST_RATE_CONTROLLER
+from retry_policy import RETRY_POLICY
+from page_ready import (PAGE_READINESS, mark_pending, network_idle, page_replaced, scroll_height_stable,
+                        select_value_applied, table_rows_stable)
+
+# Valores del select Estado del listado de emisores
+ESTADOS = {'VI': 'Vigentes', 'NV': 'No Vigentes'}
+# Primer byte y estado HTTP de la página actual, en segundos desde el inicio de la navegación
+NAVIGATION_TIMING_JS = """
+var n = performance.getEntriesByType('navigation')[0];
+return n ? [n.responseStart / 1000, n.responseStatus || 0] : null;
+"""
+
+
+def parse_date(text):
+    """Date from 'yyyy-m-d' or the old prompt's 'yyyy, m, d'"""
+    try:
+        return parser.parse(text.replace(",", "-"))
+    except (ValueError, OverflowError):
+        raise argparse.ArgumentTypeError(f"invalid date: {text!r}")
+
+
+def add_crawl_arguments(arg_parser, estado='NV', dates=True):
+    """Options shared by the crawl entry points"""
+    arg_parser.add_argument('directory', help='output directory')
+    if dates:
+        arg_parser.add_argument('--start', type=parse_date, required=True, help='first filing date, yyyy-m-d')
+        arg_parser.add_argument('--end', type=parse_date, required=True, help='last filing date, yyyy-m-d')
+    arg_parser.add_argument('--workers', type=int, default=1, help='parallel browsers / issuers (default 1)')
+    arg_parser.add_argument('--estado', choices=list(ESTADOS) + ['both'], default=estado,
+                            help=f"issuers to crawl: NV (No Vigentes), VI (Vigentes) or both (default {estado})")
+    arg_parser.add_argument('--shard', type=parse_shard, default=None, metavar='i/N',
+                            help='only crawl the issuers whose RUT hashes to shard i of N (0 <= i < N), '
+                                 'writing to DIRECTORY/shard-i-of-N; merge them with sharding.py')
+    arg_parser.add_argument('--light-browser', action='store_true',
+                            help='eager page loads without images, media, web fonts or third-party analytics hosts')
+    arg_parser.add_argument('--tabs', action='store_true',
+                            help='run the workers as tabs of a single Firefox instead of one Firefox per worker')
+
+
+def estados_from_args(args):
+    return tuple(ESTADOS) if args.estado == 'both' else (args.estado,)
+
+
+def browser_get(rate, driver, url):
+    """driver.get() in a rate slot timed to the page's first byte, not to the end of its load
+
+    Only the navigation is in the slot: the caller's element and readiness
+    waits come after it, so a missing element never reads as a slow or
+    timed-out host, while a page that does not load at all does.
+    """
+    with rate.slot(url) as slot:
+        driver.get(url)
+        try:
+            timing = driver.execute_script(NAVIGATION_TIMING_JS)
+        except WebDriverException:
+            timing = None
+        if timing and timing[0] > 0:
+            slot.timing(*timing)
+
+
+def year_options(options):
+    """Years of the `aa` select, without its leading "Seleccione" option"""
+    years = [option.strip() for option in options if option.strip()]
+    if years and not years[0].isdigit():
+        years = years[1:]
+    return years
+
+
+class CRAWL_SINK:
+    """One output of CRAWL_PIPELINE; every hook is optional
+
+    `company` is a dict with the issuer's 'link', 'url', 'rut' and its
+    detail 'record' (company_fields.company_record). Memoria Anual pages are
+    only visited when some sink sets wants_memoria, and a year page only when
+    some sink's wants_year(company, year) is true; by then company['years']
+    holds every year the issuer's `aa` select offers.
+    """
+    name = 'sink'
+    wants_memoria = False
+
+    def wants_year(self, company, year):
+        return False
+
+    def on_company(self, company):
+        pass
+
+    def on_memoria(self, company, url, html):
+        pass
+
+    def on_year(self, company, year, url, html):
+        pass
+
+    def on_company_done(self, company):
+        pass
+
+    def on_company_failed(self, company):
+        # La empresa vuelve a la cola de reintentos: descartar lo que se haya acumulado
+        pass
+
+    def close(self):
+        pass
+
+    def report(self):
+        return None
+
+
+class CRAWL_PIPELINE:
+    """Visits each issuer once and feeds its pages to every sink
+
+    Listing -> detail page -> Memoria Anual -> one page per wanted year, over
+    plain HTTP when the pages allow it and with a pooled browser otherwise.
+    The listing and the finished links are journaled under `links_key` and
+    `done_key`, so an interrupted crawl resumes where it stopped; with
+    keep_done the finished links are also skipped by later fresh listings.
+    With shard=(i, N) only the issuers of that RUT shard are crawled.
+    Issuers that fail (detail or Memoria Anual unreachable) go to a retry
+    queue that is crawled again up to `company_retries` more times, after
+    the failing hosts' circuit breakers have had time to recover; the ones
+    still failing stay pending in the journal for the next run.
+    """
+
+    def __init__(self, directory, journal, workers=1, estados=('NV',), links_key='links', done_key='finished_links',
+                 keep_done=False, replay=False, incremental=False, shard=None, company_retries=2, light_browser=False,
+                 tabs=False):
+        self.directory = directory
+        self.journal = journal
+        self.workers = workers
+        self.estados = estados
+        self.links_key = links_key
+        self.done_key = done_key
+        self.keep_done = keep_done
+        self.shard = shard
+        self.company_retries = company_retries
+        self.light_browser = light_browser
+        self.tabs = tabs
+        self.journal.state.setdefault(links_key, [])
+
+        # Métricas por etapa en metrics.json / metrics.prom, con línea de progreso y ETA
+        self.metrics = METRICS_REGISTRY(os.path.join(directory, 'metrics'))
+        # Con CMF_TRACE=1 se registran spans por empresa en trace.json (Chrome trace / Perfetto)
+        self.tracer = tracer_from_env(directory)
+        # Concurrencia y espaciado AIMD por host, compartidos por HTTP, navegadores, descargas y clasificador
+        self.rate = HOST_RATE_CONTROLLER(max_limit=max(16, 2 * workers), metrics=self.metrics)
+        # Reintentos por clase de error y circuit breakers por host, compartidos igual que el ritmo
+        self.retry = RETRY_POLICY(metrics=self.metrics)
+
+        # Sesiones de navegador reutilizables entre empresas, una por worker (o una pestaña por worker)
+        self.pool = (TAB_POOL if tabs else DRIVER_POOL)(self.setup_driver, max_size=workers)
+        # Listado, fichas y Memoria Anual en caché entre ejecuciones; en modo incremental
+        # cada página se revalida (ETag/Last-Modified, si no digest del contenido)
+        self.cache = PAGE_CACHE(os.path.join(directory, 'page_cache'), ttl=0 if incremental else 24 * 3600,
+                                replay=replay)
+        self.http = CMF_HTTP_ENGINE(pool_size=max(10, workers), cache=self.cache, tracer=self.tracer, rate=self.rate,
+                                    retry=self.retry)
+        self.ready = PAGE_READINESS(metrics=self.metrics, tracer=self.tracer)
+
+        self.lock = threading.RLock()
+        self.sinks = []
+        self.counter = 0
+
+    def setup_driver(self):
+        with self.metrics.time('browser_start_seconds'), self.tracer.span('browser start'):
+            if self.tabs:
+                driver = TABBED_FIREFOX(options=firefox_options(light=self.light_browser, page_load_strategy='none'))
+            else:
+                driver = webdriver.Firefox(options=firefox_options(light=self.light_browser))
+        driver.set_page_load_timeout(30)
+        return driver
+
+    def emit(self, hook, *args):
+        """Call `hook` on every sink; a failing sink does not stop the others"""
+        for sink in self.sinks:
+            try:
+                getattr(sink, hook)(*args)
+            except Exception as e:
+                self.metrics.inc('errors_total', stage=sink.name)
+                print(f"Error in {sink.name}.{hook}: {e}")
+
+    def wanted_years(self, company, years):
+        company['years'] = years
+        return [year for year in years if any(sink.wants_year(company, year) for sink in self.sinks)]
+
+    def emit_year(self, company, year, url, html):
+        for sink in self.sinks:
+            if sink.wants_year(company, year):
+                try:
+                    sink.on_year(company, year, url, html)
+                except Exception as e:
+                    self.metrics.inc('errors_total', stage=sink.name)
+                    print(f"Error in {sink.name}.on_year({year}): {e}")
+
+    def get_links(self):
+        """Links still to crawl, and whether they come from an interrupted run"""
+        done = self.journal.state[self.done_key]
+        remaining = [link for link in self.journal.state[self.links_key] if link not in done]
+        if remaining:
+            print("Reanudando con los enlaces pendientes de la ejecución anterior...")
+            return remaining, True
+
+        links = []
+        for estado in self.estados:
+            # Camino rápido: enviar el formulario de Estado por HTTP, sin navegador
+            estado_links = self.http.get_listing_links(estado)
+            if estado_links is None:
+                if self.http.offline:
+                    print(f"Listado {estado} no está en la caché; nada que reproducir")
+                    continue
+                estado_links = self.browser_listing(estado)
+            estado_links = [link for link in estado_links if in_shard(link, self.shard)]
+            if self.keep_done:
+                estado_links = [link for link in estado_links if link not in done]
+            print(f"Se encontraron {len(estado_links)} enlaces de empresas con estado {estado}")
+            links.extend(estado_links)
+        return list(dict.fromkeys(links)), False
+
+    def browser_listing(self, estado):
+        links = []
+        with self.pool.lease() as driver:
+            try:
+                browser_get(self.rate, driver, LISTING_URL)
+                WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, 'Estado')))
+
+                # Seleccionar el estado (Vigentes o No Vigentes); la tabla anterior queda marcada
+                mark_pending(driver, 'table')
+                driver.execute_script("arguments[0].value = arguments[1]; arguments[0].dispatchEvent(new Event('change'))",
+                                      driver.find_element(By.ID, 'Estado'), estado)
+
+                # Esperar el listado filtrado: otra tabla u otro documento, con el estado pedido
+                if not self.ready.wait(driver, 'listado estado', select_value_applied('Estado', estado, 'table'), timeout=30):
+                    raise TimeoutException(f"listing {estado} did not reload")
+                self.ready.wait(driver, 'listado filas', table_rows_stable('table tr', settle=1.0), timeout=30)
+
+                # Scroll para cargar todos los elementos
+                self.ready.wait(driver, 'listado scroll', scroll_height_stable(), timeout=30)
+                self.ready.wait(driver, 'listado red', network_idle(), timeout=10)
+                links = parse_listing_links(driver.page_source)
+            except TimeoutException:
+                print("La carga tomó demasiado tiempo!")
+            except Exception as e:
+                self.metrics.inc('errors_total', stage='listing')
+                print(f"Error al seleccionar la opción '{ESTADOS.get(estado, estado)}': {e}")
+        return links
+
+    def read_company(self, url):
+        """(detail record, detail HTML) of an issuer; the record is None when its detail table cannot be read
+
+        The HTML is only there when the page came over HTTP, for walk_memoria() to reuse.
+        """
+        # Camino rápido por HTTP; el navegador solo si la página requiere JavaScript
+        html = self.http.get_detail_html(url)
+        if html is not None:
+            pairs = pairs_from_html(html)
+            if pairs:
+                return company_record(pairs), html
+            print("Tabla de la ficha vacía por HTTP, se reintenta con el navegador")
+        if self.http.offline:
+            print(f"Ficha no está en la caché, se omite: {url}")
+            return None, None
+
+        with self.pool.lease() as driver:
+            try:
+                pairs = self.retry.call('detail', url, lambda: self.browser_detail(driver, url), max_retries=1)
+            except Exception as e:
+                self.metrics.inc('errors_total', stage='detail')
+                print(f"Error al obtener información de la empresa: {e}")
+                return None, None
+        return (company_record(pairs) if pairs else None), None
+
+    def browser_detail(self, driver, url):
+        browser_get(self.rate, driver, url)
+        with self.tracer.span('wait contenido'):
+            WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.ID, 'contenido')))
+        self.ready.wait(driver, 'ficha scroll', scroll_height_stable(), timeout=15)
+        self.ready.wait(driver, 'ficha filas', table_rows_stable('table tr'), timeout=5)
+        # Pares etiqueta/valor como JSON en una sola llamada, sin transferir page_source
+        return driver.execute_script(DETAIL_PAIRS_JS)
+
+    def walk_memoria(self, company, detail_html=None):
+        """Feed the Memoria Anual page and every wanted year page to the sinks
+
+        Raises when the Memoria Anual view cannot be reached, so the issuer is
+        retried; a page reached without a year select finishes it with no years.
+        """
+        # Camino rápido: pedir la tabla de cada año directamente, varias a la vez
+        memoria = self.http.get_memoria_page(company['url'], detail_html)
+        if memoria is not None:
+            memoria_url, memoria_html = memoria
+            years = self.wanted_years(company, year_options(select_options(memoria_html, 'aa')))
+            with self.metrics.time('year_navigation_seconds', via='http'), self.tracer.span('year pages', years=len(years)):
+                year_pages = self.http.get_year_pages(memoria_url, memoria_html, years)
+            if year_pages is not None:
+                self.emit('on_memoria', company, memoria_url, memoria_html)
+                for year, (year_url, year_html) in year_pages.items():
+                    self.emit_year(company, year, year_url, year_html)
+                return
+        if self.http.offline:
+            print(f"Memoria Anual no está en la caché, se omite: {company['url']}")
+            return
+
+        with self.pool.lease() as driver:
+            try:
+                self.retry.call('memoria', company['url'], lambda: self.browser_memoria(driver, company['url']), max_retries=1)
+
+                if urllib.parse.urlparse(driver.current_url).netloc != urllib.parse.urlparse(company['url']).netloc:
+                    # Redirección de página completa: no hay selector de años que recorrer
+                    self.emit('on_memoria', company, driver.current_url, driver.page_source)
+                    return
+                try:
+                    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, 'aa')))
+                except TimeoutException:
+                    # Página alcanzada pero sin años: la empresa queda terminada, sin reintento
+                    print("No se encontró selector de años (ID: aa)")
+                    self.wanted_years(company, [])
+                    self.emit('on_memoria', company, driver.current_url, driver.page_source)
+                    return
+                self.emit('on_memoria', company, driver.current_url, driver.page_source)
+
+                years = self.wanted_years(company, year_options(opt.text for opt in Select(driver.find_element(By.ID, 'aa')).options))
+                for year in years:
+                    with self.tracer.span('year', year=year):
+                        year_started = time.monotonic()
+                        self.browser_year(driver, company, year)
+                        self.metrics.observe('year_navigation_seconds', time.monotonic() - year_started, via='browser')
+            except NoSuchElementException:
+                print("No se encontró enlace a Memoria Anual")
+            except Exception:
+                self.metrics.inc('errors_total', stage='memoria')
+                raise
+
+    def browser_memoria(self, driver, url):
+        browser_get(self.rate, driver, url)
+        with self.tracer.span('wait cmfBtnMenuValor'):
+            WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.ID, 'cmfBtnMenuValor')))
+        # Usar JavaScript para hacer clic en el enlace, más confiable
+        memoria_link = driver.find_element(By.LINK_TEXT, 'Memoria Anual')
+        # La ficha ya cumple network_idle: marcarla para esperar el documento que la reemplaza
+        mark_pending(driver)
+        driver.execute_script("arguments[0].click();", memoria_link)
+        # Esperar a que cargue la página (puede redirigir a otro dominio)
+        if not self.ready.wait(driver, 'memoria navegación', page_replaced(), timeout=15):
+            raise TimeoutException(f"Memoria Anual did not load: {url}")
+        self.ready.wait(driver, 'memoria carga', network_idle(), timeout=15)
+
+    def browser_year(self, driver, company, year):
+        try:
+            # En el slot solo la recarga del año; la tabla de archivos se espera fuera
+            try:
+                with self.rate.slot(driver.current_url):
+                    # Usar JavaScript para seleccionar el año, evitando problemas de scrolling
+                    select_element = driver.find_element(By.ID, 'aa')
+                    mark_pending(driver)
+                    driver.execute_script(
+                        "var select = arguments[0]; "
+                        "var option = select.querySelector('option[value=\"' + arguments[1] + '\"]'); "
+                        "if(option) { select.value = option.value; select.dispatchEvent(new Event('change', { bubbles: true })); }",
+                        select_element, year
+                    )
+                    if not self.ready.wait(driver, 'año seleccionado', select_value_applied('aa', year), timeout=15):
+                        # La página no recargó: cuenta como timeout del host
+                        raise TimeoutException(f"year {year} did not load")
+            except TimeoutException:
+                print(f"No se pudo seleccionar el año {year}")
+                return
+
+            # Hacer clic en la flecha para mostrar archivos
+            try:
+                arrow_button = driver.find_element(By.CLASS_NAME, 'arriba')
+                driver.execute_script("arguments[0].click();", arrow_button)
+                self.ready.wait(driver, 'tabla año', table_rows_stable('table#Tabla tr'), timeout=5)
+            except NoSuchElementException:
+                print(f"No se encontró botón para mostrar archivos en el año {year}")
+
+            self.emit_year(company, year, driver.current_url, driver.page_source)
+        except Exception as e:
+            self.metrics.inc('errors_total', stage='year')
+            print(f"Error al procesar el año {year}: {e}")
+
+    def process_link(self, link, total, last_try=True):
+        """Crawl one issuer; runs in a worker of the pool
+
+        Returns False if it has to be retried, None if it was skipped (not in the replay cache).
+        """
+        with self.lock:
+            self.counter += 1
+            counter = self.counter
+        url = BASE_URL + link
+        print(f"\n[{counter}/{total}] Analizando: {url}")
+        company = None
+        done = False
+        try:
+            with self.metrics.time('company_seconds'), self.tracer.span('company', link=link):
+                with self.metrics.time('detail_extraction_seconds'), self.tracer.span('detail'):
+                    record, detail_html = self.read_company(url)
+                if record is None and self.http.offline:
+                    # Sin red no hay reintento que sirva; queda pendiente para una ejecución normal
+                    done = True
+                    return None
+                if record is None or not record['RUT']:
+                    self.metrics.inc('errors_total', stage='detail')
+                    print(f"No se pudo leer la ficha de {url}")
+                    return False
+                company = {'link': link, 'url': url, 'rut': record['RUT'], 'record': record}
+                self.emit('on_company', company)
+
+                if any(sink.wants_memoria for sink in self.sinks):
+                    with self.tracer.span('memoria', rut=company['rut']):
+                        self.walk_memoria(company, detail_html)
+                self.emit('on_company_done', company)
+                self.journal.add(self.done_key, link)
+                done = True
+                return True
+        except Exception as e:
+            self.metrics.inc('errors_total', stage='company')
+            print(f"Error al procesar enlace {link}: {e}")
+            if company is not None:
+                self.emit('on_company_failed', company)
+            return False
+        finally:
+            # Un reintento no vuelve a contar la empresa en el progreso
+            if done or last_try:
+                self.metrics.inc('companies_done_total')
+
+    def crawl(self, links, last_try):
+        """Process `links` in the worker pool; returns the ones that failed (not the skipped ones)"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(lambda link: self.process_link(link, len(links), last_try), links))
+        return [link for link, ok in zip(links, results) if ok is False]
+
+    def run(self, sinks):
+        """Crawl every pending issuer into `sinks`, then close them"""
+        self.sinks = sinks
+        with self.metrics.time('listing_load_seconds'):
+            links, resuming = self.get_links()
+        if not resuming:
+            # Registrar el listado nuevo una vez para poder reanudar si se interrumpe
+            self.journal.set(self.links_key, links)
+            if not self.keep_done:
+                self.journal.set(self.done_key, [])
+        self.metrics.set('companies_total', len(links))
+        self.metrics.start()
+        print(f"Se analizarán {len(links)} empresas")
+
+        failed = self.crawl(links, last_try=not self.company_retries)
+        for attempt in range(1, self.company_retries + 1):
+            if not failed:
+                break
+            # Cola de reintentos: esperar a que los circuit breakers pasen a medio abierto
+            print(f"\nReintentando {len(failed)} empresas fallidas en {self.retry.open_seconds:.0f}s "
+                  f"(ronda {attempt}/{self.company_retries})")
+            time.sleep(self.retry.open_seconds)
+            with self.lock:
+                self.counter = 0
+            failed = self.crawl(failed, last_try=attempt == self.company_retries)
+        if failed:
+            self.metrics.set('companies_failed', len(failed))
+            print(f"{len(failed)} empresas quedan pendientes para la próxima ejecución")
+
+        # Las salidas terminan su trabajo pendiente (descargas, enlaces) antes de los reportes
+        for sink in sinks:
+            sink.close()
+        self.pool.close()
+        reports = [self.pool.report(), self.http.report(), self.ready.report(), self.rate.report(), self.retry.report()]
+        for report in reports + [sink.report() for sink in sinks]:
+            if report:
+                print(report)
+        self.metrics.close()
+        self.tracer.close()
+        return len(links)
@@ -0,0 +1,430 @@
+import os
+import re
+import csv
+import threading
+import urllib.parse
+from datetime import datetime
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
+from crawl_pipeline import CRAWL_SINK, browser_get
+from http_engine import filings_digest, parse_filings
+from company_fields import OUTPUT_COLUMNS
+from pdf_downloader import PDF_DOWNLOADER
+from link_classifier import LINK_CLASSIFIER
+
+REDIRECTION_COLUMNS = ['RUT', 'Nombre_Empresa', 'URL_Original', 'URL_Externa', 'Tipo_Redirección', 'Año', 'Fecha_Detección']
+IFRAME_SRC = re.compile(r'<iframe\b[^>]*\bsrc\s*=\s*["\']([^"\']+)', re.IGNORECASE)
+
+
+class COMPANY_CSV_SINK(CRAWL_SINK):
+    """Output.csv: one row of detail fields per issuer"""
+    name = 'output_csv'
+
+    def __init__(self, pipeline, path):
+        self.journal = pipeline.journal
+        self.journal.state.setdefault('current_rut', None)
+        self.lock = threading.Lock()
+        # Check if we need to resume or start fresh
+        resume = os.path.exists(path) and self.journal.state['current_rut']
+        # RUTs already in Output.csv; a retried issuer or a later run must not add a second row
+        self.written = set(self.journal.state.get('processed_ruts', ())) if resume else set()
+        if resume:
+            print(f"Resuming from previous run at RUT: {self.journal.state['current_rut']}")
+        self.file = open(path, 'a' if resume else 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        if not resume:
+            self.writer.writerow(OUTPUT_COLUMNS)
+
+    def on_company(self, company):
+        row = [company['record'][column] for column in OUTPUT_COLUMNS]
+        with self.lock:
+            if row[0] in self.written:
+                return
+            self.written.add(row[0])
+            self.writer.writerow(row)
+            self.file.flush()
+            self.journal.set('current_rut', row[0])
+            self.journal.add('processed_ruts', row[0])
+
+    def close(self):
+        self.file.close()
+
+
+class PDF_SINK(CRAWL_SINK):
+    """Memoria Anual PDFs filed inside the date range, saved as <directory>/<year>/<RUT>_<upload>.pdf
+
+    Once an issuer is done and all its in-range filings are on disk, the
+    digest of each of its year tables is journaled. In incremental mode a
+    year with a journaled digest is not fetched again, except the newest
+    year the issuer offers, where new filings show up; a fetched year whose
+    digest is unchanged is skipped without looking at its files. A filing
+    added later to an older year is picked up by the next full run.
+    """
+    name = 'pdf'
+    wants_memoria = True
+
+    def __init__(self, pipeline, date_range, manifest, log_file, incremental=False):
+        self.directory = pipeline.directory
+        self.journal = pipeline.journal
+        self.metrics = pipeline.metrics
+        self.http = pipeline.http
+        self.date_range = date_range
+        self.manifest = manifest
+        self.log_file = log_file
+        self.incremental = incremental
+        self.downloader = PDF_DOWNLOADER(workers=max(4, pipeline.workers), metrics=pipeline.metrics, tracer=pipeline.tracer,
+                                         rate=pipeline.rate, retry=pipeline.retry)
+        self.lock = threading.Lock()
+        # link -> year digests, downloads in flight and changed/skipped years of an issuer being crawled
+        self.companies = {}
+
+    def company_state(self, link):
+        # Llamar con self.lock tomado
+        return self.companies.setdefault(link, {'digests': {}, 'files': set(), 'complete': True, 'done': False,
+                                                'changed': [], 'skipped': set()})
+
+    def wants_year(self, company, year):
+        if not self.date_range.may_contain_year(year):
+            return False
+        newest = max((y for y in company['years'] if y.isdigit()), key=int, default=None)
+        if not self.incremental or year == newest or f"{company['rut']}/{year}" not in self.journal.state['filing_digests']:
+            return True
+        with self.lock:
+            skipped = self.company_state(company['link'])['skipped']
+            first = year not in skipped
+            skipped.add(year)
+        if first:
+            self.metrics.inc('years_skipped_total')
+        return False
+
+    def on_year(self, company, year, url, html):
+        changed = self.queue_year_files(html, url, year, company)
+        with self.lock:
+            self.company_state(company['link'])['changed'].append(changed)
+
+    def on_company_done(self, company):
+        with self.lock:
+            state = self.company_state(company['link'])
+            state['done'] = True
+            changed, skipped = state['changed'], state['skipped']
+            self.record_digests(company['link'])
+        if (changed or skipped) and not any(changed):
+            print(f"Sin cambios desde la última ejecución: {company['rut']}")
+
+    def on_company_failed(self, company):
+        with self.lock:
+            self.companies.pop(company['link'], None)
+
+    def record_digests(self, link):
+        """Journal an issuer's year digests once it is done and its downloads landed; call with self.lock held"""
+        state = self.companies.get(link)
+        if state is None or not state['done'] or state['files']:
+            return
+        del self.companies[link]
+        if state['complete']:
+            for key, digest in state['digests'].items():
+                self.journal.put('filing_digests', key, digest)
+
+    def queue_year_files(self, html, page_url, year, company):
+        """Queue every in-range filing listed on one Memoria Anual year page
+
+        Returns False when incremental mode finds the year's filings unchanged since they were all downloaded.
+        """
+        com_id = company['rut']
+        # Crear carpeta si no existe
+        year_path = os.path.join(self.directory, year)
+        os.makedirs(year_path, exist_ok=True)
+
+        # Todas las filas de la tabla del año en una sola pasada (memorias rectificadas incluidas)
+        filings = parse_filings(html, page_url)
+        if not filings:
+            print(f"No se encontraron archivos para el año {year}")
+        # Verificar si la fecha está dentro del rango
+        filings = [filing for filing in filings if self.date_range.contains(filing['file_date'])]
+        digest_key = f"{com_id}/{year}"
+        digest = filings_digest(filings)
+        self.metrics.inc('filings_total', len(filings))
+        if self.incremental and self.journal.state['filing_digests'].get(digest_key) == digest:
+            self.metrics.inc('years_unchanged_total')
+            return False
+        complete = True
+        for filing in filings:
+            file_URL = filing['link']
+            if not file_URL:
+                print("No se encontró enlace de descarga.")
+                continue
+
+            # Limpiar la fecha de carga y construir nombre del archivo
+            up_date = re.sub(r'[/]', '-', filing['upload_date'])
+            up_date = re.sub(r'\s', '_', up_date)
+            up_date = re.sub(r'[:]', 'h', up_date)
+            file_name = os.path.join(year_path, f"{com_id}_{up_date}.pdf")
+
+            # Verificar si el archivo ya ha sido descargado
+            if self.manifest.has_file(file_name) or self.manifest.has_url(file_URL) or file_URL in self.journal.state['downloaded_links']:
+                print(f"El archivo ya fue descargado previamente: {file_name}")
+                continue
+            if self.http.offline:
+                print(f"Modo replay, descarga omitida: {file_name}")
+                complete = False
+                continue
+            # Registrado antes de encolar: la descarga puede terminar antes de que submit() retorne
+            with self.lock:
+                self.company_state(company['link'])['files'].add(file_name)
+            # La descarga corre en segundo plano; el recorrido sigue con el próximo año
+            if self.downloader.submit(file_URL, file_name,
+                                      lambda url, name, sha256, link=company['link']: self.on_file_downloaded(link, url, name, sha256)):
+                self.metrics.inc('pdf_queued_total')
+            else:
+                # Ya en cola desde otra página: esa descarga no avisa a esta empresa
+                with self.lock:
+                    self.company_state(company['link'])['files'].discard(file_name)
+                complete = False
+
+        # El digest se registra cuando la empresa termina y todas sus descargas llegaron
+        with self.lock:
+            state = self.company_state(company['link'])
+            state['digests'][digest_key] = digest
+            state['complete'] = state['complete'] and complete
+        return True
+
+    def on_file_downloaded(self, link, file_URL, file_name, sha256):
+        print(f"Archivo guardado: {file_name} [{self.downloader.report()}]")
+        with self.lock:
+            self.manifest.add(file_name, file_URL, sha256)
+            with open(self.log_file, 'a') as log:
+                log.write(file_name + '\n')
+            self.journal.add('downloaded_links', file_URL)
+            state = self.companies.get(link)
+            if state is not None:
+                state['files'].discard(file_name)
+                self.record_digests(link)
+
+    def close(self):
+        # Esperar a que terminen las descargas pendientes
+        self.downloader.close()
+
+    def report(self):
+        return self.downloader.report()
+
+
+class REDIRECTION_SINK(CRAWL_SINK):
+    """redirections.csv: Memoria Anual pages and download links that lead outside CMF
+
+    Full-page redirects and external iframes are found on the Memoria Anual
+    page itself; the download links of every year are classified together
+    when the issuer is done, with a browser tab only for the links
+    LINK_CLASSIFIER could not settle.
+    """
+    name = 'redirections'
+    wants_memoria = True
+
+    def __init__(self, pipeline, path):
+        self.path = path
+        self.pool = pipeline.pool
+        self.ready = pipeline.ready
+        self.metrics = pipeline.metrics
+        self.tracer = pipeline.tracer
+        # Veredictos PDF / portal externo memorizados por URL y por dominio final
+        self.classifier = LINK_CLASSIFIER(workers=max(8, 2 * pipeline.workers), rate=pipeline.rate, retry=pipeline.retry)
+        self.rate = pipeline.rate
+        self.retry = pipeline.retry
+        self.lock = threading.Lock()
+        # link -> {'origin': dominio de la Memoria Anual, 'links': [(año, url)], 'found': [...]}
+        self.companies = {}
+        self.stats = {'analizadas': 0, 'empresas_con_redirecciones': 0, 'total_redirecciones': 0}
+
+        # Crear el archivo CSV con el formato correcto
+        if not os.path.exists(self.path):
+            with open(self.path, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(REDIRECTION_COLUMNS)
+
+    def wants_year(self, company, year):
+        return True
+
+    def entry(self, company):
+        with self.lock:
+            return self.companies.setdefault(company['link'], {'origin': '', 'links': [], 'found': []})
+
+    def on_memoria(self, company, url, html):
+        entry = self.entry(company)
+        origin = urllib.parse.urlparse(company['url']).netloc
+        current = urllib.parse.urlparse(url).netloc
+        entry['origin'] = current
+        if current != origin:
+            print(f"¡Redirección de página completa detectada! {current}")
+            entry['found'].append({'tipo': 'pagina_completa', 'año': 'todos', 'url': url})
+            return
+
+        # Buscar también iframes que puedan contener portales externos
+        for src in IFRAME_SRC.findall(html):
+            iframe_src = urllib.parse.urljoin(url, src)
+            iframe_domain = urllib.parse.urlparse(iframe_src).netloc
+            if iframe_domain != '' and iframe_domain != origin:
+                print(f"¡Iframe externo detectado! {iframe_domain}")
+                entry['found'].append({'tipo': 'iframe', 'año': 'desconocido', 'url': iframe_src})
+
+    def on_year(self, company, year, url, html):
+        # Todas las filas de la tabla en una pasada; se clasifican juntas al terminar la empresa
+        year_links = [(year, filing['link']) for filing in parse_filings(html, url) if filing['link']]
+        self.entry(company)['links'].extend(year_links)
+
+    def on_company_failed(self, company):
+        with self.lock:
+            self.companies.pop(company['link'], None)
+
+    def on_company_done(self, company):
+        with self.lock:
+            entry = self.companies.pop(company['link'], None)
+        found = entry['found'] if entry else []
+        if entry and entry['links']:
+            found = found + self.classify_year_links(entry['links'], entry['origin'])
+        for link_info in found:
+            self.metrics.inc('redirections_total', tipo=link_info['tipo'])
+
+        with self.lock:
+            if found:
+                self.register_external_links(company, found)
+                self.stats['empresas_con_redirecciones'] += 1
+                self.stats['total_redirecciones'] += len(found)
+            self.stats['analizadas'] += 1
+            print(f"Progreso: {self.stats['analizadas']} empresas analizadas. Empresas con redirecciones: "
+                  f"{self.stats['empresas_con_redirecciones']}, Total redirecciones: {self.stats['total_redirecciones']}")
+
+    def classify_year_links(self, year_links, origin_domain):
+        """Clasificar los enlaces (año, url) de una empresa en un solo lote; el navegador solo para los no concluyentes"""
+        with self.metrics.time('link_batch_seconds'), self.tracer.span('link batch', links=len(year_links)):
+            verdicts = self.classifier.classify([href for _, href in year_links], origin_domain)
+
+        found = []
+        for year, href in year_links:
+            verdict = verdicts.get(href)
+            if verdict is None:
+                verdict = self.classifier.cached(href)
+            if verdict is None and self.retry.is_open(href):
+                # Host caído según su circuit breaker: ni pestaña ni espera
+                print(f"Host no disponible, enlace sin verificar: {href}")
+                verdict = (False, False, href)
+            if verdict is None:
+                with self.metrics.time('link_check_seconds'), self.tracer.span('link check', url=href):
+                    with self.pool.lease() as driver:
+                        verdict = self.check_in_browser(driver, href, origin_domain)
+                self.classifier.remember(href, verdict, origin_domain)
+            is_pdf, is_external, final_url = verdict
+
+            if is_external:
+                print(f"¡Portal externo detectado en año {year}!")
+                found.append({'tipo': 'portal_externo', 'año': year, 'url': final_url})
+            elif not is_pdf:
+                # Si no es PDF ni portal externo reconocible, lo marcamos como potencial
+                print(f"¡Enlace no reconocido como PDF en año {year}!")
+                found.append({'tipo': 'enlace_no_pdf', 'año': year, 'url': final_url})
+        return found
+
+    def check_in_browser(self, driver, url, original_domain):
+        """
+        Verifica en una pestaña nueva si un enlace lleva a un PDF o a un portal externo,
+        para los enlaces que LINK_CLASSIFIER no pudo clasificar
+        Returns:
+            - is_pdf (bool): True si es PDF
+            - is_external (bool): True si redirecciona a portal externo
+            - final_url (str): URL final después de redirecciones
+        """
+        # Completa la URL si es relativa
+        if url.startswith('/'):
+            complete_url = f"https://{original_domain}" + url
+        else:
+            complete_url = url
+
+        print(f"Comprobando enlace en el navegador: {complete_url}")
+
+        # Guardamos la ventana original para volver después
+        original_window = driver.current_window_handle
+        try:
+            # Abrimos el enlace en una nueva pestaña; new_window la asocia a este worker aunque
+            # otros trabajen en pestañas del mismo navegador (TAB_POOL)
+            driver.switch_to.new_window('tab')
+            # get() espera al documento nuevo: el about:blank de la pestaña ya está 'complete'
+            try:
+                browser_get(self.rate, driver, complete_url)
+            except TimeoutException:
+                # Página lenta: se analiza lo que alcanzó a cargar
+                pass
+
+            # Esperar a que cargue la página (con timeout reducido)
+            try:
+                WebDriverWait(driver, 10).until(lambda d: d.execute_script('return document.readyState') == 'complete')
+            except Exception:
+                pass
+
+            final_url = driver.current_url
+            final_domain = urllib.parse.urlparse(final_url).netloc
+
+            # Verificar si la URL termina en .pdf o si estamos en un dominio externo
+            is_pdf = final_url.lower().endswith('.pdf')
+            is_external = original_domain != final_domain and final_domain != ''
+
+            # Verificar si es un PDF por el contenido de la página
+            if not is_pdf:
+                try:
+                    # Si la página tiene un objeto embed o iframe con PDF, es un visor de PDF
+                    if driver.find_elements(By.CSS_SELECTOR, 'embed[type="application/pdf"], iframe[src$=".pdf"]'):
+                        is_pdf = True
+
+                    # Verificar si hay elementos que indican un portal externo (más de 5 enlaces, menús, etc.)
+                    if len(driver.find_elements(By.TAG_NAME, 'a')) > 5:
+                        is_external = True
+
+                    # Verificar el título de la página para indicios de portal
+                    page_title = driver.title.lower()
+                    portal_keywords = ['portal', 'sitio', 'inicio', 'home', 'web', 'bienvenido']
+                    if any(keyword in page_title for keyword in portal_keywords):
+                        is_external = True
+
+                except Exception as e:
+                    print(f"Error al analizar contenido: {e}")
+
+            # Cerramos la pestaña y volvemos a la original
+            driver.close()
+            driver.switch_to.window(original_window)
+
+            return is_pdf, is_external, final_url
+
+        except Exception as e:
+            print(f"Error al verificar enlace {complete_url}: {e}")
+            # En caso de error, volvemos a la ventana original si es necesario
+            try:
+                if len(driver.window_handles) > 1 and driver.current_window_handle != original_window:
+                    driver.close()
+                    driver.switch_to.window(original_window)
+            except Exception:
+                pass
+            return False, False, url
+
+    def register_external_links(self, company, external_links):
+        """Registrar información de enlaces externos en el archivo CSV"""
+        rut = company['rut'].strip()
+        nombre = company['record']['Business_Name'].strip()
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            for link_info in external_links:
+                writer.writerow([
+                    rut,
+                    nombre,
+                    company['url'],
+                    link_info['url'],
+                    link_info['tipo'],
+                    link_info['año'],
+                    datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                ])
+
+        print(f"Se registraron {len(external_links)} enlaces externos para {rut} - {nombre}")
+
+    def close(self):
+        self.classifier.close()
+
+    def report(self):
+        return (f"{self.classifier.report()}\n"
+                f"Se encontraron {self.stats['empresas_con_redirecciones']} empresas con redirecciones "
+                f"y un total de {self.stats['total_redirecciones']} redirecciones, en {self.path}")
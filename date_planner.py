@@ -0,0 +1,37 @@
+from datetime import datetime
+
+
+def as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class DATE_RANGE_PLANNER:
+    """Date-range filter over parsed intervals, instead of one 'dd/mm/YYYY' string per day"""
+
+    def __init__(self, start, end):
+        self.intervals = []
+        self.add(start, end)
+
+    def add(self, start, end):
+        start, end = as_date(start), as_date(end)
+        if start <= end:
+            self.intervals.append((start, end))
+            self.intervals.sort()
+
+    def may_contain_year(self, year):
+        """True if some day of `year` is in range, i.e. the year page is worth visiting"""
+        try:
+            year = int(str(year).strip())
+        except ValueError:
+            return False
+        return any(start.year <= year <= end.year for start, end in self.intervals)
+
+    def contains(self, day):
+        """True if a 'dd/mm/YYYY' string (or date) falls in the range"""
+        if isinstance(day, str):
+            try:
+                day = datetime.strptime(day.strip(), "%d/%m/%Y").date()
+            except ValueError:
+                return False
+        day = as_date(day)
+        return any(start <= day <= end for start, end in self.intervals)
@@ -0,0 +1,83 @@
+import os
+import re
+import json
+import threading
+
+
+def file_key(file_name):
+    """(rut, year, upload timestamp) from a '<dir>/<year>/<rut>_<dd-mm-YYYY>_<HHhMM>.pdf' path
+
+    Works with both POSIX and Windows-style (E:\\CMF\\...) paths, so entries
+    logged on another machine or drive still match.
+    """
+    parts = re.split(r'[\\/]', file_name.strip())
+    base = parts[-1]
+    year = parts[-2].strip() if len(parts) > 1 else ''
+    if base.lower().endswith('.pdf'):
+        base = base[:-4]
+    pieces = base.rsplit('_', 2)
+    if len(pieces) != 3:
+        return None
+    rut, date, hour = pieces
+    return (rut.strip(), year, f"{date}_{hour}")
+
+
+class DOWNLOAD_MANIFEST:
+    """Indexed record of downloaded PDFs backed by an append-only JSON lines file"""
+
+    def __init__(self, path, legacy_log=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.by_key = {}
+        self.by_path = {}
+        self.by_url = {}
+        if os.path.exists(self.path):
+            self.load()
+        elif legacy_log and os.path.exists(legacy_log):
+            self.import_log(legacy_log)
+
+    def load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    self.index(json.loads(line))
+                except json.JSONDecodeError:
+                    # Última línea truncada por una interrupción
+                    continue
+
+    def import_log(self, legacy_log):
+        """Seed the manifest from an existing download_log.txt"""
+        with open(legacy_log, 'r', encoding='utf-8', errors='replace') as log:
+            names = [line.rstrip('\n') for line in log if line.strip()]
+        for name in names:
+            self.add(name)
+        print(f"Imported {len(names)} entries from {legacy_log}")
+
+    def index(self, entry):
+        key = file_key(entry['path'])
+        if key is not None:
+            self.by_key[key] = entry
+        else:
+            self.by_path[entry['path']] = entry
+        if entry.get('url'):
+            self.by_url[entry['url']] = entry
+
+    def add(self, file_name, url=None, sha256=None):
+        key = file_key(file_name)
+        entry = {'path': file_name, 'url': url, 'sha256': sha256}
+        if key is not None:
+            entry.update({'rut': key[0], 'year': key[1], 'uploaded': key[2]})
+        with self.lock:
+            self.index(entry)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def has_file(self, file_name):
+        key = file_key(file_name)
+        return key in self.by_key if key is not None else file_name in self.by_path
+
+    def has_url(self, url):
+        return url in self.by_url
+
+    def __len__(self):
+        return len(self.by_key) + len(self.by_path)
@@ -0,0 +1,107 @@
+import threading
+from contextlib import contextmanager
+from selenium.common.exceptions import InvalidSessionIdException
+
+
+class DRIVER_POOL:
+    """Pool of warm WebDriver sessions shared by the CMF scrapers"""
+
+    def __init__(self, factory, max_size=1, max_uses=25):
+        # factory: callable que retorna un driver nuevo (setup_driver de cada script)
+        self.factory = factory
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.idle = []
+        self.uses = {}
+        self.leased = 0
+        self.lock = threading.Condition()
+        self.stats = {'started': 0, 'reused': 0, 'recycled': 0, 'crashed': 0}
+
+    @contextmanager
+    def lease(self):
+        """Lease a driver; it goes back to the pool when the block ends"""
+        driver = self.acquire()
+        broken = False
+        try:
+            yield driver
+        except InvalidSessionIdException:
+            # Solo una sesión muerta se descarta aquí; un timeout o un elemento
+            # que falta no la invalida y reset() detecta las que quedaron mal
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def acquire(self):
+        with self.lock:
+            while not self.idle and self.leased >= self.max_size:
+                self.lock.wait()
+            self.leased += 1
+            driver = self.idle.pop() if self.idle else None
+        if driver is not None:
+            with self.lock:
+                self.stats['reused'] += 1
+            return driver
+        try:
+            driver = self.factory()
+        except Exception:
+            with self.lock:
+                self.leased -= 1
+                self.lock.notify()
+            raise
+        with self.lock:
+            self.stats['started'] += 1
+            self.uses[id(driver)] = 0
+        return driver
+
+    def release(self, driver, broken=False):
+        with self.lock:
+            self.uses[id(driver)] = self.uses.get(id(driver), 0) + 1
+            worn_out = self.uses[id(driver)] >= self.max_uses
+        if not broken and not worn_out:
+            broken = not self.reset(driver)
+        if broken or worn_out:
+            self.discard(driver)
+            with self.lock:
+                self.stats['crashed' if broken else 'recycled'] += 1
+                self.leased -= 1
+                self.lock.notify()
+            return
+        with self.lock:
+            self.idle.append(driver)
+            self.leased -= 1
+            self.lock.notify()
+
+    def reset(self, driver):
+        """Clear cookies and extra tabs so the next company starts clean"""
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.delete_all_cookies()
+            driver.get('about:blank')
+            return True
+        except Exception as e:
+            print(f"Driver reset failed, recycling session: {e}")
+            return False
+
+    def discard(self, driver):
+        with self.lock:
+            self.uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            drivers, self.idle = self.idle, []
+        for driver in drivers:
+            self.discard(driver)
+
+    def report(self):
+        s = self.stats
+        return (f"Browser sessions: {s['started']} started, {s['reused']} reused, "
+                f"{s['recycled']} recycled, {s['crashed']} crashed")
@@ -0,0 +1,287 @@
+"""Local stand-in for the parts of cmfchile.cl the scrapers use
+
+Usage: python fixture_server.py [--port 8000] [--companies 50] [--latency 0.05] ...
+       then run a scraper with CMF_BASE_URL=http://127.0.0.1:8000/
+
+Serves the Estado listing, issuer detail pages (contenido / cmfBtnMenuValor /
+"Memoria Anual"), the Memoria Anual `aa` select with table#Tabla per year,
+PDF endpoints, and filings that redirect to an external portal (served under
+the "localhost" host name, so its domain differs from 127.0.0.1). All content
+is generated deterministically from --seed; latency and page/PDF sizes are
+configurable. Service time of every request is recorded per route.
+"""
+import time
+import random
+import argparse
+import threading
+import statistics
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LISTING_PATH = '/portal/principal/613/w3-propertyvalue-18591.html'
+ENTITY_PATH = '/institucional/mercados/entidad.php'
+ROUTES = ('listing', 'detail', 'memoria', 'year', 'pdf', 'redirect', 'portal', 'other')
+
+
+def rut_dv(rut):
+    total, factor = 0, 2
+    for digit in reversed(str(rut)):
+        total += int(digit) * factor
+        factor = 2 if factor == 7 else factor + 1
+    dv = 11 - total % 11
+    return {10: 'K', 11: '0'}.get(dv, str(dv))
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {p: 0.0 for p in points}
+    values = sorted(values)
+    return {p: values[min(len(values) - 1, int(len(values) * p / 100))] for p in points}
+
+
+class CMF_FIXTURE:
+    """Deterministic fake CMF content plus per-route timing"""
+
+    def __init__(self, companies=50, years=(2015, 2023), filings_per_year=2, external_share=0.1,
+                 latency=0.05, page_kb=60, pdf_kb=200, seed=1):
+        self.companies = companies
+        self.years = list(range(years[0], years[1] + 1))
+        self.filings_per_year = filings_per_year
+        self.external_share = external_share
+        self.latency = latency
+        self.page_kb = page_kb
+        self.pdf_kb = pdf_kb
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.timings = {route: [] for route in ROUTES}
+        self.bytes_sent = 0
+        # Relleno de navegación, para que las páginas pesen como las reales
+        item = '<div class="menu-item"><a href="#">Sección</a><span>Información para el mercado</span></div>\n'
+        self.filler = item * max(0, page_kb * 1024 // len(item))
+
+    def company(self, index):
+        rut = 76000000 + index * 7919
+        return {
+            'index': index,
+            'rut': rut,
+            'dv': rut_dv(rut),
+            'estado': 'VI' if index % 3 else 'NV',
+            'name': f"EMPRESA DE PRUEBA {index} S.A.",
+        }
+
+    def company_by_rut(self, rut):
+        try:
+            index = (int(rut) - 76000000) // 7919
+        except ValueError:
+            return None
+        return self.company(index) if 0 <= index < self.companies else None
+
+    def entity_query(self, company, pestania):
+        return urllib.parse.urlencode({'mercado': 'V', 'rut': company['rut'], 'grupo': '',
+                                       'tipoentidad': 'RVEMI', 'row': '', 'vig': company['estado'],
+                                       'control': 'svs', 'pestania': pestania})
+
+    def filings(self, company, year):
+        rng = random.Random(f"{self.seed}/{company['rut']}/{year}")
+        rows = []
+        for n in range(self.filings_per_year):
+            upload = f"{rng.randint(1, 28):02d}/{rng.randint(3, 6):02d}/{year + 1} {rng.randint(8, 19):02d}:{rng.randint(0, 59):02d}"
+            if rng.random() < self.external_share:
+                href = f"/redirect/{company['rut']}/{year}/{n}"
+            else:
+                href = f"/pdf/{company['rut']}/{year}/{n}.pdf"
+            doc_type = 'Memoria Anual' if n == 0 else 'Memoria Anual Rectificada'
+            rows.append((doc_type, upload, href))
+        return rows
+
+    def page(self, title, body):
+        return (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{title}</title></head><body>"
+                f"<div id=\"cabecera\">{self.filler}</div>{body}</body></html>")
+
+    def listing_page(self, estado):
+        rows = ['<tr><th>RUT</th><th>Entidad</th><th>Estado</th></tr>']
+        for index in range(self.companies):
+            company = self.company(index)
+            if estado not in ('TO', company['estado']):
+                continue
+            href = ENTITY_PATH.lstrip('/') + '?' + self.entity_query(company, 1)
+            rows.append(f"<tr><td>{company['rut']}-{company['dv']}</td>"
+                        f"<td><a href=\"{href}\">{company['name']}</a></td><td>{company['estado']}</td></tr>")
+        options = ''.join(f"<option value=\"{value}\"{' selected' if value == estado else ''}>{text}</option>"
+                          for value, text in (('TO', 'Todas'), ('VI', 'Vigentes'), ('NV', 'No Vigentes')))
+        form = (f"<form method=\"get\" action=\"{LISTING_PATH}\">"
+                f"<select id=\"Estado\" name=\"Estado\" onchange=\"this.form.submit()\">{options}</select></form>")
+        return self.page('Entidades', form + f"<table>{''.join(rows)}</table>")
+
+    def detail_page(self, company):
+        fields = [
+            ('R.U.T.', f"{company['rut']}-{company['dv']}"),
+            ('Razón Social', company['name']),
+            ('Nombre de Fantasía', f"PRUEBA {company['index']}"),
+            ('Vigencia', 'Vigente' if company['estado'] == 'VI' else 'No Vigente'),
+            ('Número de Inscripción', str(1000 + company['index'])),
+            ('Fecha de Inscripción', '01/01/2000'),
+            ('Fecha de Cancelación', ''),
+            ('Inscripción', 'Registro de Valores'),
+            ('Teléfono', '56 2 2617 4000'),
+            ('Fax', ''),
+            ('Domicilio', 'Av. Libertador Bernardo O\'Higgins 1449'),
+            ('Región', 'Metropolitana'),
+            ('Ciudad', 'Santiago'),
+            ('Comuna', 'Santiago'),
+            ('E-mail', f"contacto{company['index']}@example.cl"),
+            ('Sitio Web', f"www.empresa{company['index']}.cl"),
+            ('Código Postal', ''),
+            ('Nombre en Bolsa', f"PRUEBA{company['index']}"),
+        ]
+        table = ''.join(f"<tr><th>{label}:</th><td>{value}</td></tr>" for label, value in fields)
+        menu = (f"<div id=\"cmfBtnMenuValor\"><a href=\"{ENTITY_PATH}?{self.entity_query(company, 1)}\">Identificación</a>"
+                f"<a href=\"{ENTITY_PATH}?{self.entity_query(company, 7)}\">Memoria Anual</a></div>")
+        return self.page(company['name'], f"<div id=\"contenido\"><table>{table}</table>{menu}</div>")
+
+    def memoria_page(self, company, year):
+        options = '<option value="">Seleccione año</option>' + ''.join(
+            f"<option value=\"{y}\"{' selected' if str(y) == year else ''}>{y}</option>" for y in reversed(self.years))
+        hidden = ''.join(f"<input type=\"hidden\" name=\"{name}\" value=\"{value}\">"
+                         for name, value in urllib.parse.parse_qsl(self.entity_query(company, 7), keep_blank_values=True))
+        form = (f"<form method=\"get\" action=\"{ENTITY_PATH}\">{hidden}"
+                f"<select id=\"aa\" name=\"aa\" onchange=\"this.form.submit()\">{options}</select>"
+                f"<a class=\"arriba\" href=\"#\">Mostrar</a></form>")
+        table = '<tr><th>Documento</th><th>Fecha de envío</th><th>Archivo</th></tr>'
+        if year.isdigit() and int(year) in self.years:
+            table += ''.join(f"<tr><td>{doc_type}</td><td>{upload}</td><td><a href=\"{href}\">Ver documento</a></td></tr>"
+                             for doc_type, upload, href in self.filings(company, int(year)))
+        return self.page('Memoria Anual', f"<div id=\"contenido\">{form}<table id=\"Tabla\">{table}</table></div>")
+
+    def portal_page(self, path):
+        links = ''.join(f"<li><a href=\"/portal/seccion/{n}\">Sección {n}</a></li>" for n in range(12))
+        return self.page('Portal de inversionistas - Inicio', f"<h1>Inversionistas</h1><ul>{links}</ul><p>{path}</p>")
+
+    def pdf_bytes(self, path):
+        rng = random.Random(f"{self.seed}{path}")
+        return b'%PDF-1.4\n' + rng.randbytes(self.pdf_kb * 1024) + b'\n%%EOF\n'
+
+    def record(self, route, seconds, size):
+        with self.lock:
+            self.timings[route].append(seconds)
+            self.bytes_sent += size
+
+    def summary(self):
+        with self.lock:
+            timings = {route: list(values) for route, values in self.timings.items() if values}
+            bytes_sent = self.bytes_sent
+        routes = {}
+        for route, values in timings.items():
+            p = percentiles(values)
+            routes[route] = {'requests': len(values), 'mean_ms': statistics.mean(values) * 1000,
+                             'p50_ms': p[50] * 1000, 'p90_ms': p[90] * 1000, 'p99_ms': p[99] * 1000}
+        return {'routes': routes, 'bytes_sent': bytes_sent}
+
+
+class FIXTURE_HANDLER(BaseHTTPRequestHandler):
+    fixture = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            # Clientes que cortan la respuesta a propósito, como el sniffing de LINK_CLASSIFIER
+            pass
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body):
+        start = time.perf_counter()
+        fixture = self.fixture
+        if fixture.latency:
+            time.sleep(fixture.latency * random.uniform(0.5, 1.5))
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        route, status, headers, body = self.route(fixture, url.path, query)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+        fixture.record(route, time.perf_counter() - start, len(body) if send_body else 0)
+
+    def route(self, fixture, path, query):
+        html = {'Content-Type': 'text/html; charset=utf-8'}
+        if path == LISTING_PATH:
+            return 'listing', 200, html, fixture.listing_page(query.get('Estado', 'TO')).encode('utf-8')
+        if path == ENTITY_PATH:
+            company = fixture.company_by_rut(query.get('rut', ''))
+            if company is None:
+                return 'other', 404, html, b'<html><body>No encontrado</body></html>'
+            if query.get('pestania') == '7':
+                year = query.get('aa', '')
+                return ('year' if year else 'memoria'), 200, html, fixture.memoria_page(company, year).encode('utf-8')
+            return 'detail', 200, html, fixture.detail_page(company).encode('utf-8')
+        if path.startswith('/pdf/'):
+            return 'pdf', 200, {'Content-Type': 'application/pdf'}, fixture.pdf_bytes(path)
+        if path.startswith('/redirect/'):
+            # Portal externo: mismo servidor, otro nombre de host
+            location = f"http://localhost:{self.server.server_address[1]}/portal{path[len('/redirect'):]}"
+            return 'redirect', 302, {'Location': location}, b''
+        if path.startswith('/portal/'):
+            return 'portal', 200, html, fixture.portal_page(path).encode('utf-8')
+        return 'other', 404, html, b'<html><body>No encontrado</body></html>'
+
+
+def start_server(fixture, port=0):
+    """Serve `fixture` on 127.0.0.1 from a background thread; returns (server, base URL)"""
+    handler = type('BOUND_FIXTURE_HANDLER', (FIXTURE_HANDLER,), {'fixture': fixture})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def add_fixture_arguments(arg_parser):
+    arg_parser.add_argument('--companies', type=int, default=50)
+    arg_parser.add_argument('--first-year', type=int, default=2015)
+    arg_parser.add_argument('--last-year', type=int, default=2023)
+    arg_parser.add_argument('--filings-per-year', type=int, default=2)
+    arg_parser.add_argument('--external-share', type=float, default=0.1, help='share of filings that redirect to a portal')
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='mean seconds added to every response')
+    arg_parser.add_argument('--page-kb', type=int, default=60)
+    arg_parser.add_argument('--pdf-kb', type=int, default=200)
+    arg_parser.add_argument('--seed', type=int, default=1)
+
+
+def fixture_from_args(args):
+    return CMF_FIXTURE(companies=args.companies, years=(args.first_year, args.last_year),
+                       filings_per_year=args.filings_per_year, external_share=args.external_share,
+                       latency=args.latency, page_kb=args.page_kb, pdf_kb=args.pdf_kb, seed=args.seed)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--port', type=int, default=8000)
+    add_fixture_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+
+    fixture = fixture_from_args(args)
+    server, base_url = start_server(fixture, args.port)
+    print(f"Serving {args.companies} companies at {base_url} (CMF_BASE_URL={base_url}); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        for route, stats in fixture.summary()['routes'].items():
+            print(f"  {route:<9} {stats['requests']:6d} requests  p50 {stats['p50_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
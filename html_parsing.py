@@ -0,0 +1,128 @@
+import re
+from bs4 import BeautifulSoup
+
+# Backends opcionales, más rápidos que html.parser
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as SelectolaxParser
+    except ImportError:
+        SelectolaxParser = None
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Comentarios y bloques <script>/<style>: un parser no ve las etiquetas que hay dentro
+SKIPPED = r'<!--.*?-->|<(script|style)\b.*?</\1\s*>'
+ELEMENT_TAGS = {}
+
+
+def available_backends():
+    # Ordenados por velocidad medida con benchmark_parsers.py
+    backends = []
+    if lxml is not None:
+        backends.append('lxml')
+    if SelectolaxParser is not None:
+        backends.append('selectolax')
+    backends.append('html.parser')
+    return backends
+
+
+DEFAULT_BACKEND = available_backends()[0]
+
+
+def element_tags(tag):
+    """Regex matching skipped spans and <tag>/</tag>; group 2 is None for a skipped span"""
+    if tag not in ELEMENT_TAGS:
+        ELEMENT_TAGS[tag] = re.compile(SKIPPED + r'|<(/?)' + tag + r'\b([^>]*)>', re.IGNORECASE | re.DOTALL)
+    return ELEMENT_TAGS[tag]
+
+
+def slice_element(html, tag, element_id=None):
+    """Text of the first <tag> (or tag#element_id), nested ones included, without parsing the rest
+
+    Like a parser, it ignores tags written inside comments, <script> and <style>.
+    """
+    id_attr = None if element_id is None else re.compile(r'\bid\s*=\s*["\']?' + re.escape(element_id) + r'\b',
+                                                         re.IGNORECASE)
+    start, depth = None, 0
+    for match in element_tags(tag).finditer(html):
+        closing = match.group(2)
+        if closing is None:
+            continue
+        if start is None:
+            if closing or (id_attr is not None and not id_attr.search(match.group(3))):
+                continue
+            start = match.start()
+        depth += -1 if closing else 1
+        if depth == 0:
+            return html[start:match.end()]
+    return None if start is None else html[start:]
+
+
+def slice_table(html, table_id=None):
+    """Text of the first <table> (or table#table_id), nested tables included, without parsing the rest"""
+    return slice_element(html, 'table', table_id)
+
+
+def cell(tag, text, href):
+    return {'tag': tag, 'text': text, 'href': href}
+
+
+def rows_selectolax(fragment):
+    tree = SelectolaxParser(fragment)
+    rows = []
+    for tr in tree.css('tr'):
+        cells = []
+        for node in tr.css('th, td'):
+            a = node.css_first('a')
+            cells.append(cell(node.tag, node.text(deep=True, strip=False), a.attributes.get('href') if a else None))
+        rows.append(cells)
+    return rows
+
+
+def rows_lxml(fragment):
+    root = lxml.html.fragment_fromstring(fragment, create_parent='div')
+    rows = []
+    for tr in root.iter('tr'):
+        cells = []
+        for node in tr.iter('th', 'td'):
+            a = next(node.iter('a'), None)
+            cells.append(cell(node.tag, node.text_content(), a.get('href') if a is not None else None))
+        rows.append(cells)
+    return rows
+
+
+def rows_html_parser(fragment):
+    soup = BeautifulSoup(fragment, "html.parser")
+    rows = []
+    for tr in soup.findChildren('tr'):
+        cells = []
+        for node in tr.findChildren(['th', 'td']):
+            a = node.find('a')
+            cells.append(cell(node.name, node.getText(), a.get('href') if a else None))
+        rows.append(cells)
+    return rows
+
+
+BACKENDS = {
+    'selectolax': rows_selectolax,
+    'lxml': rows_lxml,
+    'html.parser': rows_html_parser,
+}
+
+
+def table_rows(html, table_id=None, backend=None):
+    """Rows of the target table as lists of {'tag', 'text', 'href'} cells; [] if the page has no such table"""
+    fragment = slice_table(html, table_id)
+    if fragment is None:
+        return []
+    return BACKENDS[backend or DEFAULT_BACKEND](fragment)
+
+
+def td_cells(row):
+    """Data cells of a row, as findChildren('td') returned them"""
+    return [c for c in row if c['tag'] == 'td']
+
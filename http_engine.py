@@ -0,0 +1,265 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import urllib.parse
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+from html_parsing import slice_element, slice_table, table_rows, td_cells
+from tracing import SPAN_TRACER
+from rate_controller import HOST_RATE_CONTROLLER
+from retry_policy import RETRY_POLICY
+
+# CMF_BASE_URL apunta los scripts a otro servidor, p. ej. fixture_server.py en benchmarks
+BASE_URL = os.environ.get('CMF_BASE_URL', 'https://www.cmfchile.cl/')
+LISTING_URL = BASE_URL + 'portal/principal/613/w3-propertyvalue-18591.html'
+UPLOAD_DATE = re.compile(r'\d{1,2}/\d{1,2}/\d{4}')
+CONTENIDO = re.compile(r'\bid\s*=\s*["\']?contenido\b', re.IGNORECASE)
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+def form_payload(form, overrides=None):
+    """Build the request a browser would send when submitting `form`"""
+    payload = {}
+    for field in form.find_all(['input', 'select', 'textarea']):
+        name = field.get('name')
+        if not name or field.has_attr('disabled'):
+            continue
+        if field.name == 'select':
+            option = field.find('option', selected=True) or field.find('option')
+            payload[name] = option.get('value', option.getText()) if option else ''
+        elif field.get('type', '').lower() in ('checkbox', 'radio'):
+            if field.has_attr('checked'):
+                payload[name] = field.get('value', 'on')
+        elif field.get('type', '').lower() not in ('submit', 'button', 'image', 'reset', 'file'):
+            payload[name] = field.get('value', '')
+    payload.update(overrides or {})
+    return payload
+
+
+def find_select_form(html, select_id):
+    """Return (form, select name) for the form that owns select#select_id"""
+    soup = BeautifulSoup(html, "html.parser")
+    select = soup.find('select', id=select_id)
+    if select is None:
+        return None, None
+    return select.find_parent('form'), select.get('name') or select_id
+
+
+def parse_listing_links(html):
+    """Issuer detail links from the listing table (second column)"""
+    link_lst = []
+    for row in table_rows(html):
+        td = td_cells(row)
+        if len(td) > 1 and td[1]['href']:
+            link_lst.append(td[1]['href'])
+    return link_lst
+
+
+def parse_filings(html, page_url):
+    """Every filing row of a Memoria Anual year table, in one pass
+
+    Returns dicts with 'upload_date' ('dd/mm/YYYY HH:MM' as shown), 'file_date'
+    (the day part), 'doc_type' (first column) and 'link' (absolute URL, or
+    None when the row has no document link).
+    """
+    rows = table_rows(html, 'Tabla') or table_rows(html)
+    filings = []
+    for row in rows:
+        td = td_cells(row)
+        if len(td) < 2:
+            continue
+        upload_date = td[1]['text'].strip()
+        if not UPLOAD_DATE.match(upload_date):
+            continue
+        hrefs = [c['href'] for c in td if c['href']]
+        filings.append({
+            'upload_date': upload_date,
+            'file_date': upload_date.split(' ')[0].strip(),
+            'doc_type': td[0]['text'].strip(),
+            'link': urllib.parse.urljoin(page_url, hrefs[0]) if hrefs else None,
+        })
+    return filings
+
+
+def filings_digest(filings):
+    """Digest of a set of filing rows, independent of their order on the page"""
+    rows = sorted((f['upload_date'], f['doc_type'], f['link'] or '') for f in filings)
+    return hashlib.sha256(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def find_link_by_text(html, text):
+    """href of the first <a> whose text is `text` (as By.LINK_TEXT matches it)"""
+    soup = BeautifulSoup(html, "html.parser")
+    for a in soup.find_all('a', href=True):
+        if a.getText().strip() == text:
+            return a['href']
+    return None
+
+
+def select_options(html, select_id):
+    """Option texts of select#select_id, [] if the page has no such select"""
+    soup = BeautifulSoup(html, "html.parser")
+    select = soup.find('select', id=select_id)
+    if select is None:
+        return []
+    return [option.getText().strip() for option in select.find_all('option')]
+
+
+def selected_option(html, select_id):
+    """Value select#select_id shows (the first option when none is selected), None without the select"""
+    # Solo el select: se llama una vez por página de año
+    fragment = slice_element(html, 'select', select_id)
+    select = BeautifulSoup(fragment, "html.parser").find('select') if fragment is not None else None
+    if select is None:
+        return None
+    option = select.find('option', selected=True) or select.find('option')
+    if option is None:
+        return None
+    return option.get('value', option.getText()).strip()
+
+
+def has_detail_table(html):
+    """True when the detail page was served complete, without needing JavaScript"""
+    return CONTENIDO.search(html) is not None and slice_table(html) is not None
+
+
+class CMF_HTTP_ENGINE:
+    """Fetches CMF pages over plain HTTP; callers fall back to Selenium on None"""
+
+    def __init__(self, pool_size=10, timeout=15, fanout=6, cache=None, tracer=None, rate=None, retry=None):
+        self.timeout = timeout
+        self.fanout = fanout
+        # PAGE_CACHE opcional; en modo replay no se hace ninguna petición de red
+        self.cache = cache
+        self.tracer = tracer or SPAN_TRACER()
+        # Ritmo por host compartido con el navegador, las descargas y el clasificador de enlaces
+        self.rate = rate or HOST_RATE_CONTROLLER()
+        # Reintentos con backoff y circuit breaker por host
+        self.retry = retry or RETRY_POLICY()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(HEADERS)
+        self.stats = {'http': 0, 'fallback': 0}
+        self.lock = threading.Lock()
+
+    def fetch_page(self, url, method='GET', data=None):
+        """(final URL, HTML) of a page, or None if the request failed"""
+        with self.tracer.span('http ' + method, url=url):
+            return self.request_page(url, method, data)
+
+    def request_page(self, url, method, data):
+        if self.cache is not None:
+            page = self.cache.get(url, method, data)
+            if page is not None or self.offline:
+                return page
+        # Una entrada vencida se revalida con una petición condicional
+        headers = self.cache.validators(url, method, data) if self.cache is not None else {}
+        try:
+            response = self.retry.call('http', url, lambda: self.send(url, method, data, headers))
+            if response.status_code == 304 and headers:
+                page = self.cache.revalidated(url, method, data)
+                # Entrada desalojada mientras tanto: se pide de nuevo, ya sin validadores
+                return page if page is not None else self.fetch_page(url, method, data)
+            if self.cache is not None:
+                self.cache.put(url, method, data, response.url, response.text,
+                               response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            return response.url, response.text
+        except Exception as e:
+            print(f"HTTP fetch failed for {url}: {e}")
+            return None
+
+    def send(self, url, method, data, headers):
+        with self.rate.slot(url) as slot:
+            if method == 'POST':
+                response = slot.response(self.session.post(url, data=data, headers=headers, timeout=self.timeout))
+            else:
+                response = slot.response(self.session.get(url, params=data, headers=headers, timeout=self.timeout))
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    @property
+    def offline(self):
+        """True when pages may only come from the cache (replay mode)"""
+        return self.cache is not None and self.cache.replay
+
+    def fetch(self, url, method='GET', data=None):
+        page = self.fetch_page(url, method, data)
+        return page[1] if page is not None else None
+
+    def submit_select(self, url, html, select_id, value):
+        """Submit the form around select#select_id with `value`, as its change handler does"""
+        form, name = find_select_form(html, select_id)
+        if form is None:
+            return None
+        action = urllib.parse.urljoin(url, form.get('action') or url)
+        method = form.get('method', 'GET').upper()
+        if method != 'POST':
+            # Como el navegador, un GET reemplaza la query de la acción con los campos del formulario
+            action = urllib.parse.urlunparse(urllib.parse.urlparse(action)._replace(query=''))
+        return self.fetch_page(action, method, form_payload(form, {name: value}))
+
+    def get_listing_links(self, estado):
+        """Links of the issuer listing filtered by Estado, or None if it needs a browser"""
+        html = self.fetch(LISTING_URL)
+        page = self.submit_select(LISTING_URL, html, 'Estado', estado) if html is not None else None
+        # Un servidor que ignora el parámetro devuelve otro listado: solo vale si muestra el estado pedido
+        if page is None or selected_option(page[1], 'Estado') != estado:
+            return self.result(None)
+        links = parse_listing_links(page[1])
+        return self.result(links or None)
+
+    def get_detail_html(self, link):
+        """HTML of an issuer detail page, or None if it needs a browser"""
+        html = self.fetch(urllib.parse.urljoin(BASE_URL, link))
+        return self.result(html if html is not None and has_detail_table(html) else None)
+
+    def get_memoria_page(self, link, detail_html=None):
+        """(URL, HTML) of the issuer's Memoria Anual view, or None if reaching it needs a browser
+
+        detail_html is the detail page already fetched by get_detail_html(), so it is not requested twice.
+        """
+        detail_url = urllib.parse.urljoin(BASE_URL, link)
+        html = detail_html if detail_html is not None else self.fetch(detail_url)
+        href = find_link_by_text(html, 'Memoria Anual') if html is not None else None
+        if not href or href.lower().startswith('javascript:'):
+            return self.result(None)
+        page = self.fetch_page(urllib.parse.urljoin(detail_url, href))
+        if page is None or not select_options(page[1], 'aa'):
+            return self.result(None)
+        return self.result(page)
+
+    def get_year_pages(self, memoria_url, memoria_html, years):
+        """{year: (URL, HTML)} for each year of the `aa` select, fetched concurrently
+
+        Returns None if any year cannot be served without a browser, so the
+        caller can fall back to driving the dropdown.
+        """
+        if not years:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(years), self.fanout)) as executor:
+            pages = list(executor.map(lambda year: self.submit_select(memoria_url, memoria_html, 'aa', year), years))
+        # Como en search_files: verificar que el año realmente se seleccionó, no solo que hay tabla
+        if any(page is None or slice_table(page[1], 'Tabla') is None or selected_option(page[1], 'aa') != year
+               for year, page in zip(years, pages)):
+            return self.result(None)
+        return self.result(dict(zip(years, pages)))
+
+    def result(self, value):
+        with self.lock:
+            self.stats['http' if value is not None else 'fallback'] += 1
+        return value
+
+    def report(self):
+        report = f"HTTP fast path: {self.stats['http']} pages, {self.stats['fallback']} Selenium fallbacks"
+        if self.cache is not None:
+            report += f"\n{self.cache.report()}"
+        return report
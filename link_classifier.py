@@ -0,0 +1,170 @@
+import re
+import time
+import threading
+import urllib.parse
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from http_engine import HEADERS
+from rate_controller import HOST_RATE_CONTROLLER
+from retry_policy import RETRY_POLICY
+
+
+SNIFF_BYTES = 8192
+PDF_MAGIC = b'%PDF-'
+META_REFRESH = re.compile(rb'<meta[^>]+http-equiv=["\']?refresh["\']?[^>]*?url=\s*["\']?([^"\'>\s]+)', re.IGNORECASE)
+JS_LOCATION = re.compile(rb'location(?:\.href)?\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+PDF_VIEWER = re.compile(rb'<(?:embed|object)\b[^>]*application/pdf|<iframe\b[^>]*src=["\'][^"\']*\.pdf\b', re.IGNORECASE)
+TITLE = re.compile(rb'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+ANCHOR = re.compile(rb'<a\s[^>]*href=["\']?([^"\'>\s]+)', re.IGNORECASE)
+# Las mismas señales de portal que miraba la pestaña del navegador
+PORTAL_KEYWORDS = ('portal', 'sitio', 'inicio', 'home', 'web', 'bienvenido')
+
+
+def netloc(url):
+    return urllib.parse.urlparse(url).netloc
+
+
+def classify_prefix(prefix, content_type, final_url, origin_domain):
+    """Verdict from the first bytes of a response, or None if they do not settle it"""
+    if prefix.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(PDF_MAGIC) or 'application/pdf' in content_type:
+        return True, False, final_url
+    final_domain = netloc(final_url)
+    if final_domain and final_domain != origin_domain:
+        return False, True, final_url
+    if 'html' not in content_type and not prefix.lstrip().lower().startswith((b'<!doctype', b'<html')):
+        # Otro tipo de archivo (zip, doc, ...) servido por el mismo dominio
+        return (False, False, final_url) if prefix else None
+    # Redirección por <meta refresh> o JavaScript hacia otro dominio
+    for pattern in (META_REFRESH, JS_LOCATION):
+        match = pattern.search(prefix)
+        if match:
+            target = urllib.parse.urljoin(final_url, match.group(1).decode('latin-1'))
+            if netloc(target) and netloc(target) != origin_domain:
+                return False, True, target
+    if PDF_VIEWER.search(prefix):
+        return True, False, final_url
+    title = TITLE.search(prefix)
+    title = title.group(1).decode('utf-8', 'replace').lower() if title else ''
+    # A diferencia de la pestaña, solo cuentan los enlaces a otros dominios: los menús de CMF no son un portal
+    offsite = [href for href in ANCHOR.findall(prefix)
+               if netloc(urllib.parse.urljoin(final_url, href.decode('latin-1'))) not in ('', origin_domain)]
+    if any(keyword in title for keyword in PORTAL_KEYWORDS) or len(offsite) > 5:
+        return False, True, final_url
+    # Página HTML del mismo dominio sin señales de PDF ni de portal
+    return False, False, final_url
+
+
+class LINK_CLASSIFIER:
+    """Classifies download links as PDF / external portal, concurrently and memoized
+
+    Each link is probed with one streamed GET that follows redirects and
+    reads only the first SNIFF_BYTES: %PDF- magic or a PDF Content-Type, the
+    final domain, and light HTML heuristics on the prefix (meta refresh / JS
+    redirects, PDF viewers, portal title and link count). A verdict is
+    (is_pdf, is_external, final_url), or None when the probe failed and the
+    caller has to fall back to a browser. Verdicts are remembered per URL for
+    `ttl` seconds, and so are hosts whose links redirect to an external
+    domain: later links on such a host are not probed again, unless their
+    path looks like a PDF. Hosts whose circuit breaker is open fail without
+    a request.
+    """
+
+    def __init__(self, workers=8, ttl=3600, timeout=10, session=None, sniff_bytes=SNIFF_BYTES, rate=None, retry=None):
+        self.ttl = ttl
+        self.rate = rate or HOST_RATE_CONTROLLER()
+        self.retry = retry or RETRY_POLICY()
+        self.sniff_bytes = sniff_bytes
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(HEADERS)
+        self.session = session
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.by_url = {}
+        self.by_domain = {}
+        self.stats = {'memo': 0, 'probed': 0, 'inconclusive': 0}
+
+    def cached(self, url):
+        now = time.time()
+        with self.lock:
+            entry = self.by_url.get(url)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            # Un PDF directo se revisa siempre: el host puede redirigir el resto a un portal
+            if urllib.parse.urlparse(url).path.lower().endswith('.pdf'):
+                return None
+            entry = self.by_domain.get(netloc(url))
+            if entry is not None and entry[1] > now:
+                return (False, True, url)
+        return None
+
+    def remember(self, url, verdict, origin_domain=None):
+        if verdict is None:
+            return
+        expires = time.time() + self.ttl
+        with self.lock:
+            self.by_url[url] = (verdict, expires)
+            # Solo un host que redirige fuera de sí mismo: un portal servido en su propio
+            # dominio puede tener también PDFs directos
+            link_domain, final_domain = netloc(url), netloc(verdict[2])
+            if verdict[1] and final_domain and link_domain not in (final_domain, origin_domain):
+                self.by_domain[link_domain] = (verdict, expires)
+
+    def probe(self, url, origin_domain):
+        """Verdict for one link, or None if it could not be fetched; no retries, a dead host only trips its breaker"""
+        try:
+            return self.retry.call('probe', url, lambda: self.sniff(url, origin_domain), max_retries=0)
+        except Exception as e:
+            print(f"No se pudo verificar con requests: {e}")
+            return None
+
+    def sniff(self, url, origin_domain):
+        """Streamed GET with redirects followed, reading only the first sniff_bytes"""
+        with self.rate.slot(url) as slot:
+            with slot.response(self.session.get(url, stream=True, allow_redirects=True, timeout=self.timeout)) as response:
+                content_type = response.headers.get('Content-Type', '').lower()
+                if '.pdf' in response.headers.get('Content-Disposition', '').lower():
+                    return True, False, response.url
+                prefix = b''
+                if response.ok:
+                    for chunk in response.iter_content(2048):
+                        prefix += chunk
+                        if len(prefix) >= self.sniff_bytes:
+                            break
+                # Una redirección a otro dominio basta aunque la página final dé error
+                if not response.ok and netloc(response.url) == origin_domain:
+                    return None
+                return classify_prefix(prefix[:self.sniff_bytes], content_type, response.url, origin_domain)
+
+    def classify(self, urls, origin_domain):
+        """{url: verdict or None} for every link, probing the ones not memoized in parallel"""
+        verdicts = {}
+        to_probe = []
+        for url in dict.fromkeys(urls):
+            verdict = self.cached(url)
+            if verdict is not None:
+                verdicts[url] = verdict
+            else:
+                to_probe.append(url)
+        probed = list(self.executor.map(lambda url: self.probe(url, origin_domain), to_probe))
+        for url, verdict in zip(to_probe, probed):
+            self.remember(url, verdict, origin_domain)
+            verdicts[url] = verdict
+        with self.lock:
+            self.stats['memo'] += len(verdicts) - len(to_probe)
+            self.stats['probed'] += len(to_probe)
+            self.stats['inconclusive'] += sum(1 for verdict in probed if verdict is None)
+        return verdicts
+
+    def close(self):
+        self.executor.shutdown()
+
+    def report(self):
+        s = self.stats
+        return (f"Link classifier: {s['probed']} probed, {s['memo']} from memo, "
+                f"{s['inconclusive']} left to the browser")
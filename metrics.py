@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Límites de los histogramas de duración, en segundos
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+
+def series_key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+class METRICS_REGISTRY:
+    """Counters, gauges and duration histograms, flushed periodically to disk
+
+    Every `interval` seconds the registry is written to <path>.json and to
+    <path>.prom (Prometheus text format, for node_exporter's textfile
+    collector), and a progress line with rate and ETA is printed from the
+    `done` counter and `total` gauge.
+    """
+
+    def __init__(self, path=None, interval=15, done='companies_done_total', total='companies_total', unit='companies'):
+        self.path = path
+        self.interval = interval
+        self.done = done
+        self.total = total
+        self.unit = unit
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def inc(self, name, value=1, **labels):
+        key = series_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[series_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, series_key(name, labels), tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Observe the duration of the with-block in histogram `name`"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def value(self, name):
+        with self.lock:
+            return self.counters.get(name, self.gauges.get(name, 0))
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'elapsed_seconds': time.time() - self.started,
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {key: {'buckets': dict(zip(map(str, BUCKETS), h['buckets'])),
+                                     'sum': h['sum'], 'count': h['count']}
+                               for (_, key, _), h in self.histograms.items()},
+            }
+
+    def prometheus(self):
+        lines = []
+        with self.lock:
+            for key, value in sorted(self.counters.items()):
+                lines.append(f"cmf_{key} {value}")
+            for key, value in sorted(self.gauges.items()):
+                lines.append(f"cmf_{key} {value}")
+            for (name, _, labels), h in sorted(self.histograms.items()):
+                for bound, count in zip(BUCKETS, h['buckets']):
+                    le = '+Inf' if bound == float('inf') else str(bound)
+                    lines.append(f"cmf_{series_key(name + '_bucket', dict(labels, le=le))} {count}")
+                lines.append(f"cmf_{series_key(name + '_sum', dict(labels))} {h['sum']:.6f}")
+                lines.append(f"cmf_{series_key(name + '_count', dict(labels))} {h['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def progress_line(self):
+        done, total = self.value(self.done), self.value(self.total)
+        elapsed = max(time.time() - self.started, 1e-6)
+        rate = done / elapsed * 60
+        line = f"[progress] {done}/{total} {self.unit}"
+        if total:
+            line += f" ({done / total:.1%})"
+        line += f", {rate:.1f}/min"
+        if done and total > done:
+            line += f", ETA {format_duration((total - done) / done * elapsed)}"
+        pdfs = self.value('pdf_files_total')
+        if pdfs:
+            line += f", {pdfs} PDFs ({self.value('pdf_bytes_total') / 1048576:.1f} MB)"
+        errors = sum(v for k, v in self.snapshot()['counters'].items() if k.startswith('errors_total'))
+        return line + f", {errors} errors"
+
+    def flush(self):
+        if self.path is None:
+            return
+        for suffix, content in (('.json', json.dumps(self.snapshot(), indent=1)), ('.prom', self.prometheus())):
+            tmp = self.path + suffix + '.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.replace(tmp, self.path + suffix)
+            except OSError as e:
+                print(f"Could not write metrics to {self.path + suffix}: {e}")
+
+    def start(self):
+        """Flush and print progress every `interval` seconds from a background thread"""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+            print(self.progress_line())
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        print(self.progress_line())
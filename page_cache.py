@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+def request_key(url, method='GET', data=None):
+    """Cache key of a request: URL, method and form fields, in a stable order"""
+    form = sorted((str(k), str(v)) for k, v in (data or {}).items())
+    raw = json.dumps([method.upper(), url, form], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class PAGE_CACHE:
+    """On-disk cache of fetched pages, with TTL and size-based LRU eviction
+
+    Each request is stored as a small entry file (<key>.json) pointing at a
+    content-addressed body (<sha256>.html), so identical pages reached by
+    different requests are kept once. Entries are evicted least recently used
+    first once the bodies exceed max_bytes. Expired entries are kept, with
+    their ETag/Last-Modified, so they can be revalidated with a conditional
+    request. In replay mode entries never expire and nothing new is stored:
+    everything is served from disk.
+    """
+
+    def __init__(self, directory, ttl=24 * 3600, max_bytes=200 * 1024 * 1024, replay=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stored': 0, 'evicted': 0,
+                      'not_modified': 0, 'unchanged': 0}
+        os.makedirs(directory, exist_ok=True)
+        # key -> entry, ordered from least to most recently used
+        self.entries = {}
+        self.blob_refs = {}
+        self.blob_sizes = {}
+        self.load()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, digest + '.html')
+
+    def load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+                size = os.path.getsize(self.blob_path(entry['body']))
+                found.append((os.path.getmtime(path), name[:-5], entry, size))
+            except (OSError, ValueError, KeyError):
+                # Entrada incompleta o sin cuerpo: se descarta
+                self.remove_file(path)
+        for _, key, entry, size in sorted(found):
+            self.index(key, entry, size)
+        for name in os.listdir(self.directory):
+            if name.endswith('.html') and name[:-5] not in self.blob_refs:
+                self.remove_file(os.path.join(self.directory, name))
+
+    def index(self, key, entry, size):
+        self.entries[key] = entry
+        self.blob_refs[entry['body']] = self.blob_refs.get(entry['body'], 0) + 1
+        self.blob_sizes[entry['body']] = size
+
+    def size(self):
+        return sum(self.blob_sizes.values())
+
+    def get(self, url, method='GET', data=None):
+        """(final URL, HTML) of a cached request, or None on a miss or expired entry"""
+        key = request_key(url, method, data)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and not self.replay and time.time() - entry['stored'] > self.ttl:
+                self.stats['expired'] += 1
+                return None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            page = self.read(key)
+            self.stats['hits' if page is not None else 'misses'] += 1
+            return page
+
+    def read(self, key):
+        entry = self.entries[key]
+        try:
+            with open(self.blob_path(entry['body']), 'r', encoding='utf-8') as f:
+                html = f.read()
+        except OSError:
+            self.drop(key)
+            return None
+        # Marcar como usado recientemente, en memoria y en disco para la próxima ejecución
+        self.entries[key] = self.entries.pop(key)
+        try:
+            os.utime(self.entry_path(key))
+        except OSError:
+            pass
+        return entry['final_url'], html
+
+    def validators(self, url, method='GET', data=None):
+        """Conditional-request headers for a cached (usually expired) request, {} if there is nothing to revalidate"""
+        with self.lock:
+            entry = self.entries.get(request_key(url, method, data))
+        headers = {}
+        if entry is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def revalidated(self, url, method='GET', data=None):
+        """Serve the cached page after a 304 Not Modified, restarting its TTL"""
+        key = request_key(url, method, data)
+        with self.lock:
+            if key not in self.entries:
+                return None
+            page = self.read(key)
+            if page is not None:
+                entry = self.entries[key]
+                entry['stored'] = time.time()
+                try:
+                    self.write_atomic(self.entry_path(key), json.dumps(entry).encode('utf-8'))
+                except OSError as e:
+                    print(f"Page cache write failed for {url}: {e}")
+                self.stats['not_modified'] += 1
+            return page
+
+    def put(self, url, method, data, final_url, html, etag=None, last_modified=None):
+        if self.replay:
+            return
+        key = request_key(url, method, data)
+        body = html.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        entry = {'url': url, 'method': method.upper(), 'final_url': final_url,
+                 'body': digest, 'stored': time.time(), 'etag': etag, 'last_modified': last_modified}
+        with self.lock:
+            if key in self.entries and self.entries[key]['body'] == digest:
+                # Sin validadores HTTP: el digest del contenido dice si la página cambió
+                self.stats['unchanged'] += 1
+            try:
+                if digest not in self.blob_sizes:
+                    self.write_atomic(self.blob_path(digest), body)
+                self.write_atomic(self.entry_path(key), json.dumps(entry).encode('utf-8'))
+            except OSError as e:
+                print(f"Page cache write failed for {url}: {e}")
+                return
+            if key in self.entries:
+                self.release_blob(self.entries.pop(key)['body'], keep=digest)
+            self.index(key, entry, len(body))
+            self.stats['stored'] += 1
+            self.evict()
+
+    def write_atomic(self, path, content):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def evict(self):
+        total = self.size()
+        while total > self.max_bytes and len(self.entries) > 1:
+            key = next(iter(self.entries))
+            digest = self.entries[key]['body']
+            freed = self.blob_sizes[digest] if self.blob_refs[digest] == 1 else 0
+            self.drop(key)
+            self.stats['evicted'] += 1
+            total -= freed
+
+    def drop(self, key):
+        entry = self.entries.pop(key)
+        self.remove_file(self.entry_path(key))
+        self.release_blob(entry['body'])
+
+    def release_blob(self, digest, keep=None):
+        self.blob_refs[digest] -= 1
+        if self.blob_refs[digest] == 0:
+            del self.blob_refs[digest]
+            del self.blob_sizes[digest]
+            if digest != keep:
+                self.remove_file(self.blob_path(digest))
+
+    def remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def report(self):
+        mode = 'replay only' if self.replay else f"TTL {self.ttl / 3600:.0f} h"
+        return (f"Page cache ({mode}): {self.stats['hits']} hits, {self.stats['misses']} misses, "
+                f"{self.stats['expired']} expired, {self.stats['not_modified']} not modified, "
+                f"{self.stats['unchanged']} unchanged, {self.stats['stored']} stored, {self.stats['evicted']} evicted, "
+                f"{len(self.entries)} entries / {self.size() / (1024 * 1024):.1f} MB")
@@ -0,0 +1,118 @@
+import time
+import threading
+from selenium.common.exceptions import WebDriverException
+from tracing import SPAN_TRACER
+
+# Marca el documento y la tabla actuales antes de una acción que recarga la página
+MARK_PENDING_JS = """
+window.__cmfPending = true;
+var t = document.querySelector(arguments[0]);
+if (t) { t.__cmfPending = true; }
+"""
+
+SELECT_APPLIED_JS = """
+var t = document.querySelector(arguments[2]);
+var s = document.getElementById(arguments[0]);
+return document.readyState == 'complete'
+    && (!window.__cmfPending || (t != null && !t.__cmfPending))
+    && s != null && s.value == arguments[1];
+"""
+
+# Otro documento (ya sin la marca de mark_pending) con el DOM listo
+PAGE_REPLACED_JS = "return !window.__cmfPending && document.readyState != 'loading';"
+
+NETWORK_STATE_JS = """
+return [document.readyState, performance.getEntriesByType('resource').length];
+"""
+
+
+def stable(probe, settle, accept=None):
+    """Condition that holds once probe(driver) has returned the same acceptable value for `settle` seconds"""
+    state = {'value': None, 'since': None}
+
+    def condition(driver):
+        value = probe(driver)
+        now = time.monotonic()
+        if state['since'] is None or value != state['value']:
+            state['value'], state['since'] = value, now
+            return False
+        return now - state['since'] >= settle and (accept is None or accept(value))
+    return condition
+
+
+def table_rows_stable(selector='table tr', settle=0.5):
+    """Row count under `selector` is non-zero and has stopped changing"""
+    probe = lambda driver: driver.execute_script("return document.querySelectorAll(arguments[0]).length", selector)
+    return stable(probe, settle, accept=lambda count: count > 0)
+
+
+def scroll_height_stable(settle=0.5):
+    """Page scrolled to the bottom and no more content is being appended"""
+    return stable(lambda driver: driver.execute_script(
+        "window.scrollTo(0, document.body.scrollHeight); return document.body.scrollHeight"), settle)
+
+
+def network_idle(quiet=0.5):
+    """Document loaded and no new resource requests for `quiet` seconds"""
+    return stable(lambda driver: driver.execute_script(NETWORK_STATE_JS), quiet,
+                  accept=lambda state: state[0] == 'complete')
+
+
+def select_value_applied(select_id, value, table='table#Tabla'):
+    """The page reloaded (or `table` was replaced) after mark_pending() and the select shows `value`"""
+    return lambda driver: driver.execute_script(SELECT_APPLIED_JS, select_id, value, table)
+
+
+def page_replaced():
+    """A new document has been loaded since mark_pending(), wherever it redirected to"""
+    return lambda driver: driver.execute_script(PAGE_REPLACED_JS)
+
+
+def mark_pending(driver, table='table#Tabla'):
+    """Mark the current document and `table` so the waits above only accept what replaces them"""
+    driver.execute_script(MARK_PENDING_JS, table)
+
+
+class PAGE_READINESS:
+    """Waits for page conditions instead of fixed sleeps and records how long each wait took"""
+
+    def __init__(self, poll=0.1, metrics=None, tracer=None):
+        self.poll = poll
+        self.metrics = metrics
+        self.tracer = tracer or SPAN_TRACER()
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.timeouts = {}
+
+    def wait(self, driver, name, condition, timeout=10):
+        """Poll `condition` until it holds; returns False on timeout instead of raising"""
+        start = time.monotonic()
+        ready = False
+        with self.tracer.span('wait ' + name):
+            while True:
+                try:
+                    ready = bool(condition(driver))
+                except WebDriverException:
+                    # La página puede estar en medio de una recarga
+                    ready = False
+                if ready or time.monotonic() - start >= timeout:
+                    break
+                time.sleep(self.poll)
+        elapsed = time.monotonic() - start
+        with self.lock:
+            self.timings.setdefault(name, []).append(elapsed)
+            if not ready:
+                self.timeouts[name] = self.timeouts.get(name, 0) + 1
+        if self.metrics is not None:
+            self.metrics.observe('page_wait_seconds', elapsed, wait=name)
+            if not ready:
+                self.metrics.inc('page_wait_timeouts_total', wait=name)
+        return ready
+
+    def report(self):
+        lines = ['Page waits:']
+        with self.lock:
+            for name, values in sorted(self.timings.items()):
+                lines.append(f"  {name}: {len(values)} waits, avg {sum(values) / len(values):.2f}s, "
+                             f"max {max(values):.2f}s, {self.timeouts.get(name, 0)} timeouts")
+        return '\n'.join(lines)
@@ -0,0 +1,119 @@
+import os
+import hashlib
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from tracing import SPAN_TRACER
+from rate_controller import HOST_RATE_CONTROLLER
+from retry_policy import RETRY_POLICY
+
+
+class PDF_DOWNLOADER:
+    """Background PDF download stage fed by the browsing workers"""
+
+    def __init__(self, workers=4, timeout=60, chunk_size=64 * 1024, metrics=None, tracer=None, rate=None, retry=None):
+        self.metrics = metrics
+        self.tracer = tracer or SPAN_TRACER()
+        # Descargas simultáneas y espaciado por host según la respuesta del servidor
+        self.rate = rate or HOST_RATE_CONTROLLER()
+        self.retry = retry or RETRY_POLICY(metrics=metrics)
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'User-Agent': 'Mozilla/5.0'})
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.stats = {'files': 0, 'bytes': 0, 'errors': 0}
+        self.started = time.time()
+        self.threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, url, file_name, on_done=None):
+        """Queue `url` to be saved as `file_name`; on_done(url, file_name, sha256) runs after it lands"""
+        with self.lock:
+            if file_name in self.pending:
+                return False
+            self.pending.add(file_name)
+        self.queue.put((url, file_name, on_done))
+        if self.metrics is not None:
+            self.metrics.set('pdf_queue_depth', self.queue.qsize())
+        return True
+
+    def worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            url, file_name, on_done = job
+            try:
+                start = time.monotonic()
+                with self.tracer.span('pdf download', url=url, file=os.path.basename(file_name)):
+                    size, digest = self.retry.call('pdf', url, lambda: self.fetch(url, file_name))
+                with self.lock:
+                    self.stats['files'] += 1
+                    self.stats['bytes'] += size
+                if self.metrics is not None:
+                    self.metrics.observe('pdf_download_seconds', time.monotonic() - start)
+                    self.metrics.inc('pdf_files_total')
+                    self.metrics.inc('pdf_bytes_total', size)
+                if on_done is not None:
+                    on_done(url, file_name, digest)
+            except Exception as e:
+                with self.lock:
+                    self.stats['errors'] += 1
+                if self.metrics is not None:
+                    self.metrics.inc('errors_total', stage='pdf')
+                print(f"Error al descargar {url}: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(file_name)
+                if self.metrics is not None:
+                    self.metrics.set('pdf_queue_depth', self.queue.qsize())
+                self.queue.task_done()
+
+    def fetch(self, url, file_name):
+        # Se escribe a un .part y se renombra, para no dejar PDFs truncados
+        part_name = file_name + '.part'
+        size = 0
+        digest = hashlib.sha256()
+        try:
+            with self.rate.slot(url) as slot, slot.response(self.session.get(url, stream=True, timeout=self.timeout)) as response:
+                response.raise_for_status()
+                with open(part_name, 'wb') as out_file:
+                    for chunk in response.iter_content(self.chunk_size):
+                        out_file.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+        except Exception:
+            if os.path.exists(part_name):
+                os.remove(part_name)
+            raise
+        os.replace(part_name, file_name)
+        return size, digest.hexdigest()
+
+    def join(self):
+        """Block until every queued download has finished"""
+        self.queue.join()
+
+    def close(self):
+        self.join()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.session.close()
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        s = self.stats
+        return (f"PDF downloads: {s['files']} files, {s['bytes'] / 1048576:.1f} MB "
+                f"({s['bytes'] / elapsed / 1024:.0f} KB/s), {s['errors']} errors, "
+                f"queue depth {self.queue.qsize()}")
@@ -0,0 +1,161 @@
+import time
+import threading
+import urllib.parse
+from contextlib import contextmanager
+import requests
+
+# Respuestas que indican que el servidor pide bajar el ritmo
+THROTTLE_STATUS = (429, 500, 502, 503, 504)
+
+
+def is_timeout(error):
+    if isinstance(error, (requests.Timeout, requests.ConnectionError, TimeoutError, ConnectionError)):
+        return True
+    # selenium.common.exceptions.TimeoutException, sin importar selenium aquí
+    return type(error).__name__ == 'TimeoutException'
+
+
+def retry_after_seconds(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class RATE_SLOT:
+    """One request in flight; the caller records the response on it
+
+    Latency is measured up to response(), i.e. to the headers, so a long
+    body transfer keeps the slot busy without reading as a slow server.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.status = None
+        self.retry_after = None
+        self.started = time.monotonic()
+        self.answered = None
+
+    def response(self, response):
+        self.answered = time.monotonic()
+        self.status = response.status_code
+        self.retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+        return response
+
+    def timing(self, seconds, status=None):
+        """Record a response timed elsewhere, e.g. by the browser's Navigation Timing"""
+        self.answered = self.started + seconds
+        self.status = status or None
+
+    def latency(self):
+        return (self.answered or time.monotonic()) - self.started
+
+
+class HOST_RATE_CONTROLLER:
+    """Per-host AIMD limit on requests in flight and on the spacing between request starts
+
+    Every completed request feeds back its latency and outcome. A fast
+    success raises the host's concurrency limit additively (+1 per window)
+    and trims the spacing by `spacing_step`; a 429/5xx, a timeout or a
+    response slower than `slow_factor` times the host's baseline latency
+    halves the limit and doubles the spacing, at most once per smoothed
+    latency (and never more often than `cooldown`) so a burst of failures
+    from one window of requests counts as one signal. Retry-After is
+    honoured. Shared by the HTTP engine, the browser workers, the PDF
+    downloader and the link prober so they all back off together.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=16, min_spacing=0.0, max_spacing=10.0, spacing_step=0.01,
+                 slow_factor=4.0, slow_floor=2.0, cooldown=0.05, metrics=None):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.min_spacing = min_spacing
+        self.max_spacing = max_spacing
+        self.spacing_step = spacing_step
+        self.slow_factor = slow_factor
+        self.slow_floor = slow_floor
+        self.cooldown = cooldown
+        self.metrics = metrics
+        self.lock = threading.Condition()
+        self.hosts = {}
+
+    def host_state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = {'limit': float(self.initial), 'in_flight': 0, 'spacing': self.min_spacing,
+                                        'next_start': 0.0, 'baseline': None, 'srtt': 0.0, 'last_decrease': 0.0,
+                                        'requests': 0, 'throttled': 0, 'timeouts': 0, 'slow': 0}
+        return state
+
+    @contextmanager
+    def slot(self, url):
+        """Hold one of the host's in-flight slots for the duration of the with-block"""
+        host = urllib.parse.urlparse(url).netloc
+        self.acquire(host)
+        slot = RATE_SLOT(host)
+        try:
+            yield slot
+        except Exception as e:
+            self.release(slot, timeout=is_timeout(e))
+            raise
+        else:
+            self.release(slot)
+
+    def acquire(self, host):
+        with self.lock:
+            while True:
+                state = self.host_state(host)
+                now = time.monotonic()
+                if state['in_flight'] < int(state['limit']):
+                    if now >= state['next_start']:
+                        state['in_flight'] += 1
+                        state['next_start'] = now + state['spacing']
+                        return
+                    self.lock.wait(state['next_start'] - now)
+                else:
+                    self.lock.wait()
+
+    def release(self, slot, timeout=False):
+        seconds = slot.latency()
+        with self.lock:
+            state = self.host_state(slot.host)
+            state['in_flight'] -= 1
+            state['requests'] += 1
+            throttled = slot.status in THROTTLE_STATUS
+            slow = (not timeout and not throttled and state['baseline'] is not None
+                    and seconds > max(self.slow_factor * state['baseline'], self.slow_floor))
+            ok = slot.status is None or slot.status < 400
+            state['srtt'] = seconds if not state['srtt'] else 0.8 * state['srtt'] + 0.2 * seconds
+            if ok and not timeout and not throttled:
+                # Línea base: la latencia mínima, que sube muy despacio si el servidor se vuelve más lento
+                baseline = state['baseline']
+                state['baseline'] = seconds if baseline is None or seconds < baseline else baseline + (seconds - baseline) * 0.01
+            if throttled or timeout or slow:
+                state['throttled' if throttled else 'timeouts' if timeout else 'slow'] += 1
+                now = time.monotonic()
+                if now - state['last_decrease'] >= max(state['srtt'], self.cooldown):
+                    state['last_decrease'] = now
+                    state['limit'] = max(float(self.min_limit), state['limit'] / 2)
+                    state['spacing'] = min(self.max_spacing, max(state['spacing'] * 2, 5 * self.spacing_step))
+                if slot.retry_after is not None:
+                    state['next_start'] = max(state['next_start'], now + min(slot.retry_after, self.max_spacing * 6))
+            elif ok:
+                state['limit'] = min(float(self.max_limit), state['limit'] + 1 / state['limit'])
+                state['spacing'] = max(self.min_spacing, state['spacing'] - self.spacing_step)
+            limit, spacing = state['limit'], state['spacing']
+            self.lock.notify_all()
+        if self.metrics is not None:
+            self.metrics.set('host_concurrency_limit', round(limit, 2), host=slot.host)
+            self.metrics.set('host_spacing_seconds', round(spacing, 3), host=slot.host)
+            if throttled or timeout or slow:
+                self.metrics.inc('host_backoffs_total', host=slot.host,
+                                 reason='throttled' if throttled else 'timeout' if timeout else 'slow')
+
+    def report(self):
+        lines = ['Rate control:']
+        with self.lock:
+            for host, s in sorted(self.hosts.items()):
+                lines.append(f"  {host}: {s['requests']} requests, limit {s['limit']:.1f}, spacing {s['spacing']:.2f}s, "
+                             f"{s['throttled']} throttled, {s['timeouts']} timeouts, {s['slow']} slow")
+        return '\n'.join(lines)
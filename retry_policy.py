@@ -0,0 +1,162 @@
+import time
+import random
+import threading
+import urllib.parse
+import requests
+from rate_controller import is_timeout, retry_after_seconds
+
+# Reintentos por clase de error: (reintentos, espera base, espera máxima) en segundos
+RULES = {
+    'timeout': (2, 1.0, 10.0),
+    'connection': (2, 1.0, 10.0),
+    'throttled': (4, 2.0, 60.0),
+    'server': (3, 1.0, 20.0),
+    'client': (0, 0.0, 0.0),
+    'other': (0, 0.0, 0.0),
+}
+# Clases que indican que el host está caído o saturado, y cuentan para su circuit breaker
+HOST_FAILURES = ('timeout', 'connection', 'throttled', 'server')
+
+
+class CircuitOpenError(Exception):
+    """Raised without touching the network while a host's circuit breaker is open"""
+
+
+def error_class(error):
+    if isinstance(error, CircuitOpenError):
+        return 'circuit'
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is not None:
+        if status in (429, 503):
+            return 'throttled'
+        if status >= 500:
+            return 'server'
+        if status >= 400:
+            return 'client'
+    if isinstance(error, (requests.Timeout, TimeoutError)) or type(error).__name__ == 'TimeoutException':
+        return 'timeout'
+    if is_timeout(error):
+        # requests.ConnectionError / ConnectionError: conexión rechazada, DNS, reset
+        return 'connection'
+    return 'other'
+
+
+class RETRY_POLICY:
+    """Retries with jittered exponential backoff per error class, behind per-host circuit breakers
+
+    call() runs a request function; on failure the error class picks how
+    many retries are left and the backoff (full jitter: a random wait up to
+    base * 2^attempt, capped, and at least the server's Retry-After).
+    `failure_threshold` consecutive host failures open the host's breaker:
+    for `open_seconds` every call to that host raises CircuitOpenError
+    immediately, then a single trial call decides whether it closes again
+    or stays open twice as long (up to `max_open_seconds`).
+    """
+
+    def __init__(self, rules=None, failure_threshold=5, open_seconds=30.0, max_open_seconds=300.0, metrics=None):
+        self.rules = dict(RULES, **(rules or {}))
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.stats = {'retries': 0, 'rejected': 0, 'opened': 0}
+
+    def breaker(self, host):
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = {'failures': 0, 'open_until': 0.0, 'open_seconds': self.open_seconds,
+                                             'trial': False}
+        return breaker
+
+    def is_open(self, url):
+        host = urllib.parse.urlparse(url).netloc
+        with self.lock:
+            breaker = self.breakers.get(host)
+            return breaker is not None and (breaker['open_until'] > time.monotonic() or breaker['trial'])
+
+    def admit(self, host):
+        """Raise CircuitOpenError unless the host's breaker lets this call through"""
+        with self.lock:
+            breaker = self.breaker(host)
+            if breaker['failures'] < self.failure_threshold:
+                return False
+            if breaker['open_until'] <= time.monotonic() and not breaker['trial']:
+                # Medio abierto: una sola llamada de prueba
+                breaker['trial'] = True
+                return True
+            self.stats['rejected'] += 1
+        if self.metrics is not None:
+            self.metrics.inc('circuit_rejections_total', host=host)
+        raise CircuitOpenError(f"circuit open for {host}")
+
+    def record(self, host, trial, error_kind=None):
+        opened = False
+        with self.lock:
+            breaker = self.breaker(host)
+            breaker['trial'] = False
+            if error_kind is None:
+                breaker['failures'] = 0
+                breaker['open_seconds'] = self.open_seconds
+                return
+            if error_kind not in HOST_FAILURES:
+                return
+            breaker['failures'] += 1
+            if trial:
+                breaker['open_seconds'] = min(self.max_open_seconds, breaker['open_seconds'] * 2)
+            if breaker['failures'] >= self.failure_threshold:
+                breaker['open_until'] = time.monotonic() + breaker['open_seconds']
+                opened = breaker['failures'] == self.failure_threshold or trial
+                if opened:
+                    self.stats['opened'] += 1
+        if opened:
+            print(f"Circuit breaker abierto para {host} ({breaker['open_seconds']:.0f}s)")
+            if self.metrics is not None:
+                self.metrics.inc('circuit_opened_total', host=host)
+
+    def backoff(self, kind, attempt, error=None):
+        _, base, cap = self.rules[kind]
+        delay = random.uniform(0, min(cap, base * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        retry_after = retry_after_seconds(response.headers.get('Retry-After')) if response is not None else None
+        return max(delay, min(retry_after, cap)) if retry_after is not None else delay
+
+    def call(self, stage, url, fn, max_retries=None):
+        """fn() with retries for `stage`; max_retries caps the error class's own retry count"""
+        host = urllib.parse.urlparse(url).netloc
+        attempt = 0
+        while True:
+            trial = self.admit(host)
+            try:
+                result = fn()
+            except Exception as e:
+                kind = error_class(e)
+                self.record(host, trial, kind)
+                retries = self.rules.get(kind, RULES['other'])[0]
+                if max_retries is not None:
+                    retries = min(retries, max_retries)
+                # Sin reintento si este fallo dejó el circuito abierto: el host se da por caído
+                if attempt >= retries or self.is_open(url):
+                    raise
+                delay = self.backoff(kind, attempt, e)
+                attempt += 1
+                with self.lock:
+                    self.stats['retries'] += 1
+                if self.metrics is not None:
+                    self.metrics.inc('retries_total', stage=stage, error=kind)
+                print(f"Reintento {attempt}/{retries} de {stage} en {delay:.1f}s ({kind}): {url}")
+                time.sleep(delay)
+            else:
+                self.record(host, trial)
+                return result
+
+    def report(self):
+        s = self.stats
+        with self.lock:
+            open_hosts = sorted(host for host, b in self.breakers.items() if b['open_until'] > time.monotonic())
+        line = f"Retries: {s['retries']} retries, {s['opened']} circuits opened, {s['rejected']} calls rejected"
+        if open_hosts:
+            line += f"; open now: {', '.join(open_hosts)}"
+        return line
@@ -0,0 +1,156 @@
+"""Deterministic issuer sharding by RUT, and the merge of per-shard outputs
+
+Usage: python sharding.py DIRECTORY [SHARD_DIR ...]
+
+A crawl started with --shard i/N (0 <= i < N) only visits the issuers whose
+RUT hashes to i, and writes to DIRECTORY/shard-i-of-N. Shards can run as
+separate processes or on separate machines; once their directories are
+gathered, merging combines Output.csv, redirections.csv and the download
+manifests into DIRECTORY, linking (or copying) the PDFs into its
+<year>/ folders. Without SHARD_DIR arguments every DIRECTORY/shard-*-of-*
+directory is merged.
+"""
+import os
+import re
+import csv
+import sys
+import glob
+import json
+import zlib
+import shutil
+import argparse
+import urllib.parse
+from download_manifest import DOWNLOAD_MANIFEST
+
+SHARD = re.compile(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+
+
+def parse_shard(text):
+    """(index, count) from 'i/N', for argparse"""
+    match = SHARD.match(text)
+    if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise argparse.ArgumentTypeError(f"expected i/N with 0 <= i < N, got {text!r}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def link_rut(link):
+    """RUT in an issuer link's query string, or the whole link if it has none"""
+    rut = urllib.parse.parse_qs(urllib.parse.urlparse(link).query).get('rut', [''])[0]
+    return rut.strip() or link
+
+
+def shard_of(link, count):
+    # crc32 y no hash(): el reparto tiene que ser igual en todos los procesos y máquinas
+    return zlib.crc32(link_rut(link).encode('utf-8')) % count
+
+
+def in_shard(link, shard):
+    return shard is None or shard_of(link, shard[1]) == shard[0]
+
+
+def shard_directory(directory, shard):
+    if shard is None:
+        return directory
+    return os.path.join(directory, f"shard-{shard[0]}-of-{shard[1]}")
+
+
+def read_csv(path):
+    if not os.path.exists(path):
+        return None, []
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    return (rows[0], rows[1:]) if rows else (None, [])
+
+
+def merge_csv(path, shard_paths, key):
+    """Concatenate the shards' CSV files into `path`, keeping the first row for each key"""
+    header, rows, seen = None, [], set()
+    for shard_path in shard_paths:
+        shard_header, shard_rows = read_csv(shard_path)
+        header = header or shard_header
+        for row in shard_rows:
+            if row and key(row) not in seen:
+                seen.add(key(row))
+                rows.append(row)
+    if header is None:
+        return 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return len(rows)
+
+
+def link_or_copy(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def merge_manifests(directory, shard_dirs):
+    """Link every shard's downloaded PDFs into directory/<year>/ and record them in its manifest
+
+    Manifest paths may have been written on another machine, so files are
+    located by their <year>/<name> tail inside the shard directory.
+    """
+    log_file = os.path.join(directory, 'download_log.txt')
+    manifest = DOWNLOAD_MANIFEST(os.path.join(directory, 'download_manifest.jsonl'), log_file)
+    merged = 0
+    for shard_dir in shard_dirs:
+        shard_manifest = os.path.join(shard_dir, 'download_manifest.jsonl')
+        if not os.path.exists(shard_manifest):
+            continue
+        with open(shard_manifest, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                tail = re.split(r'[\\/]', entry['path'])[-2:]
+                source = os.path.join(shard_dir, *tail)
+                target = os.path.join(directory, *tail)
+                if manifest.has_file(target) or not os.path.exists(source):
+                    continue
+                if not os.path.exists(target):
+                    link_or_copy(source, target)
+                manifest.add(target, entry.get('url'), entry.get('sha256'))
+                with open(log_file, 'a') as log:
+                    log.write(target + '\n')
+                merged += 1
+    return merged
+
+
+def merge_shards(directory, shard_dirs=None):
+    """Combine the shards' outputs into `directory`; returns the merged counts"""
+    if not shard_dirs:
+        shard_dirs = sorted(glob.glob(os.path.join(directory, 'shard-*-of-*')))
+    counts = {
+        'shards': len(shard_dirs),
+        'companies': merge_csv(os.path.join(directory, 'Output.csv'),
+                               [os.path.join(d, 'Output.csv') for d in shard_dirs], key=lambda row: row[0].strip()),
+        # Fecha_Detección (última columna) no cuenta para repetir una redirección
+        'redirections': merge_csv(os.path.join(directory, 'redirections.csv'),
+                                  [os.path.join(d, 'redirections.csv') for d in shard_dirs], key=lambda row: tuple(row[:-1])),
+        'pdfs': merge_manifests(directory, shard_dirs),
+    }
+    return counts
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('directory', help='directory the shards were started with; merged outputs go here')
+    arg_parser.add_argument('shard_dirs', nargs='*', help='shard directories (default: DIRECTORY/shard-*-of-*)')
+    args = arg_parser.parse_args(argv)
+    counts = merge_shards(args.directory, args.shard_dirs)
+    if not counts['shards']:
+        print(f"No shard directories found in {args.directory}")
+        return 1
+    print(f"Merged {counts['shards']} shards into {args.directory}: {counts['companies']} companies, "
+          f"{counts['redirections']} redirections, {counts['pdfs']} PDFs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
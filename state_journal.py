@@ -0,0 +1,105 @@
+import os
+import json
+import threading
+
+
+class STATE_JOURNAL:
+    """Crash-safe progress store: a JSON snapshot plus an append-only journal of changes
+
+    Each change costs one appended line. Every `compact_every` changes the
+    current state is written to the snapshot (atomically, via os.replace) and
+    the journal is truncated. On start-up the snapshot is loaded and the
+    journal replayed on top; replaying is idempotent, so a crash during
+    compaction loses nothing. Keys in `sets` hold sets (add) and keys in
+    `maps` hold dicts (put); both start out empty.
+    """
+
+    def __init__(self, base_path, sets=(), maps=(), compact_every=1000):
+        self.snapshot_file = base_path + '.snapshot.json'
+        self.journal_file = base_path + '.journal'
+        self.sets = set(sets)
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.state = {key: set() for key in self.sets}
+        self.state.update({key: {} for key in maps})
+        self.is_new = not (os.path.exists(self.snapshot_file) or os.path.exists(self.journal_file))
+        self.pending = 0
+        self.replay()
+        self.handle = open(self.journal_file, 'a', encoding='utf-8')
+
+    def replay(self):
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                for key, value in json.load(f).items():
+                    self.state[key] = set(value) if key in self.sets else value
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        for line in content.splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Línea incompleta de una ejecución interrumpida
+                continue
+            self.apply(entry['op'], entry['key'], entry['value'])
+            self.pending += 1
+        if content and not content.endswith('\n'):
+            # Cerrar la línea truncada para que la próxima entrada no se pegue a ella
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write('\n')
+
+    def apply(self, op, key, value):
+        if op == 'add':
+            self.state.setdefault(key, set()).add(value)
+        elif op == 'set':
+            self.state[key] = set(value) if key in self.sets else value
+        elif op == 'put':
+            field, field_value = value
+            self.state.setdefault(key, {})[field] = field_value
+
+    def add(self, key, value):
+        """Add `value` to the set `key`"""
+        with self.lock:
+            if value not in self.state.get(key, ()):
+                self.write('add', key, value)
+
+    def set(self, key, value):
+        """Replace the value of `key` (for set keys, with the items of `value`)"""
+        with self.lock:
+            self.write('set', key, value)
+
+    def put(self, key, field, value):
+        """Set `field` of the mapping `key` to `value`"""
+        with self.lock:
+            if self.state.get(key, {}).get(field) != value:
+                self.write('put', key, [field, value])
+
+    def write(self, op, key, value):
+        self.apply(op, key, value)
+        self.handle.write(json.dumps({'op': op, 'key': key, 'value': value}, ensure_ascii=False) + '\n')
+        self.handle.flush()
+        self.pending += 1
+        if self.pending >= self.compact_every:
+            self.compact_locked()
+
+    def compact(self):
+        with self.lock:
+            self.compact_locked()
+
+    def compact_locked(self):
+        data = {key: (sorted(value) if key in self.sets else value) for key, value in self.state.items()}
+        tmp_file = self.snapshot_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        self.handle.close()
+        self.handle = open(self.journal_file, 'w', encoding='utf-8')
+        self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.compact_locked()
+            self.handle.close()
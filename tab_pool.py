@@ -0,0 +1,243 @@
+import time
+import threading
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import InvalidSessionIdException, TimeoutException, WebDriverException
+from selenium.webdriver.remote.command import Command
+
+# Documento nuevo (ya sin la marca puesta antes de navegar) con el DOM listo
+NAVIGATED_JS = "return !window.__tabNavigating && document.readyState != 'loading';"
+
+
+class TABBED_FIREFOX(webdriver.Firefox):
+    """Firefox session whose tabs are driven by several threads at once
+
+    A thread works on the tab it entered (TAB_POOL does this on lease).
+    Every WebDriver command, element commands included, first switches the
+    session to the calling thread's tab under a lock, so commands from
+    different tabs run one at a time while their waits (polling, sleeps,
+    page loads) overlap. window_handles only lists the thread's own tabs.
+    Start it with page_load_strategy 'none': get() then waits for
+    DOMContentLoaded outside the lock instead of blocking the whole session.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.tab_lock = threading.RLock()
+        self.tab_state = threading.local()
+        self.active_tab = None
+        self.load_timeout = 30
+        self.poll = 0.05
+        super().__init__(*args, **kwargs)
+        # Ventana inicial: queda en blanco y es desde donde se abren las pestañas
+        self.home = self.current_window_handle
+
+    def execute(self, driver_command, params=None):
+        tab = getattr(self.tab_state, 'tab', None)
+        with self.tab_lock:
+            if tab is None:
+                return super().execute(driver_command, params)
+            if driver_command == Command.SWITCH_TO_WINDOW:
+                response = super().execute(driver_command, params)
+                self.active_tab = self.tab_state.tab = params['handle']
+                return response
+            if self.active_tab != tab:
+                # Falla con NoSuchWindowException si el hilo cerró su pestaña, igual que un driver propio
+                super().execute(Command.SWITCH_TO_WINDOW, {'handle': tab})
+                self.active_tab = tab
+            response = super().execute(driver_command, params)
+            if driver_command == Command.NEW_WINDOW:
+                self.tab_state.handles.append(response['value']['handle'])
+            elif driver_command == Command.CLOSE:
+                if tab in self.tab_state.handles:
+                    self.tab_state.handles.remove(tab)
+                self.active_tab = None
+            elif driver_command == Command.W3C_GET_WINDOW_HANDLES:
+                response['value'] = [handle for handle in response['value'] if handle in self.tab_state.handles]
+            return response
+
+    def get(self, url):
+        """Navigate the current tab and wait for DOMContentLoaded without holding the session"""
+        try:
+            self.execute_script("window.__tabNavigating = true;")
+        except WebDriverException:
+            pass
+        super().get(url)
+        deadline = time.monotonic() + self.load_timeout
+        while True:
+            try:
+                if self.execute_script(NAVIGATED_JS):
+                    return
+            except WebDriverException:
+                # El documento puede estar cambiando justo ahora
+                pass
+            if time.monotonic() >= deadline:
+                raise TimeoutException(f"Timed out loading {url}")
+            time.sleep(self.poll)
+
+    def set_page_load_timeout(self, time_to_wait):
+        self.load_timeout = time_to_wait
+        super().set_page_load_timeout(time_to_wait)
+
+    def open_tab(self):
+        with self.tab_lock:
+            # New Window falla si la pestaña activa ya se cerró
+            super().execute(Command.SWITCH_TO_WINDOW, {'handle': self.home})
+            self.active_tab = self.home
+            return super().execute(Command.NEW_WINDOW, {'type': 'tab'})['value']['handle']
+
+    def enter(self, tab):
+        """Make `tab` the calling thread's tab"""
+        self.tab_state.tab = tab
+        self.tab_state.handles = [tab]
+
+    def leave(self):
+        self.tab_state.tab = None
+        self.tab_state.handles = []
+
+
+class TAB_POOL:
+    """Tabs of one shared browser process, a drop-in for DRIVER_POOL
+
+    `factory` must return a TABBED_FIREFOX. Each lease gets its own tab, so
+    `max_size` issuers are crawled at once for the memory of one Firefox
+    plus a content process per tab instead of a whole browser each. The
+    browser's first window stays blank and is never leased, so closing a
+    tab never ends the session. Tabs share cookies and cache: a reset only
+    closes the lease's extra tabs and blanks the page.
+    """
+
+    def __init__(self, factory, max_size=1, max_uses=25):
+        self.factory = factory
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.browser = None
+        self.idle = []
+        self.uses = {}
+        self.leased = 0
+        self.lock = threading.Condition()
+        self.start_lock = threading.Lock()
+        self.stats = {'browsers': 0, 'tabs': 0, 'reused': 0, 'recycled': 0, 'crashed': 0}
+
+    @contextmanager
+    def lease(self):
+        """Lease a tab; the shared driver acts on it from this thread until the block ends"""
+        browser, tab = self.acquire()
+        broken = False
+        try:
+            yield browser
+        except InvalidSessionIdException:
+            # Como en DRIVER_POOL: los demás errores pasan por reset(), que cierra la pestaña si quedó mal
+            broken = True
+            raise
+        finally:
+            self.release(browser, tab, broken=broken)
+
+    def acquire(self):
+        with self.lock:
+            while not self.idle and self.leased >= self.max_size:
+                self.lock.wait()
+            self.leased += 1
+            tab = self.idle.pop() if self.idle else None
+            browser = self.browser
+        if tab is not None:
+            with self.lock:
+                self.stats['reused'] += 1
+        else:
+            try:
+                browser, tab = self.new_tab()
+            except Exception:
+                with self.lock:
+                    self.leased -= 1
+                    self.lock.notify()
+                raise
+        browser.enter(tab)
+        return browser, tab
+
+    def new_tab(self):
+        with self.start_lock:
+            if self.browser is None:
+                browser = self.factory()
+                with self.lock:
+                    self.browser = browser
+                    self.stats['browsers'] += 1
+            browser = self.browser
+        tab = browser.open_tab()
+        with self.lock:
+            self.stats['tabs'] += 1
+            self.uses[tab] = 0
+        return browser, tab
+
+    def release(self, browser, tab, broken=False):
+        with self.lock:
+            self.uses[tab] = self.uses.get(tab, 0) + 1
+            worn_out = self.uses[tab] >= self.max_uses
+            current = browser is self.browser
+        if not broken and not worn_out and current:
+            broken = not self.reset(browser, tab)
+        if broken or worn_out or not current:
+            self.discard(browser, tab)
+            with self.lock:
+                self.stats['crashed' if broken else 'recycled'] += 1
+                self.leased -= 1
+                self.lock.notify()
+            return
+        browser.leave()
+        with self.lock:
+            self.idle.append(tab)
+            self.leased -= 1
+            self.lock.notify()
+
+    def reset(self, browser, tab):
+        """Close the lease's extra tabs and blank its own one"""
+        try:
+            for handle in browser.window_handles:
+                if handle != tab:
+                    browser.switch_to.window(handle)
+                    browser.close()
+            browser.switch_to.window(tab)
+            browser.get('about:blank')
+            return True
+        except Exception as e:
+            print(f"Tab reset failed, closing it: {e}")
+            return False
+
+    def discard(self, browser, tab):
+        try:
+            for handle in browser.window_handles:
+                browser.switch_to.window(handle)
+                browser.close()
+        except Exception:
+            pass
+        browser.leave()
+        with self.lock:
+            self.uses.pop(tab, None)
+        try:
+            # La ventana inicial sigue abierta mientras el navegador viva
+            browser.window_handles
+        except Exception as e:
+            print(f"Browser session lost, starting a new one: {e}")
+            self.drop(browser)
+
+    def drop(self, browser):
+        with self.lock:
+            if self.browser is browser:
+                self.browser = None
+                self.idle = []
+        try:
+            browser.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            browser, self.browser, self.idle = self.browser, None, []
+        if browser is not None:
+            try:
+                browser.quit()
+            except Exception:
+                pass
+
+    def report(self):
+        s = self.stats
+        return (f"Browser tabs: {s['tabs']} opened in {s['browsers']} browser(s), {s['reused']} reused, "
+                f"{s['recycled']} recycled, {s['crashed']} crashed")
@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Context manager compartido cuando el trazado está desactivado: sin asignaciones por span
+NULL_SPAN = nullcontext()
+
+
+class SPAN_TRACER:
+    """Opt-in span recorder, written as Chrome trace / Perfetto JSON
+
+    With path=None every span() is a shared no-op context manager. Otherwise
+    each span becomes a complete ("X") event on its thread's timeline, so
+    nested spans show up as a flame chart in chrome://tracing or
+    ui.perfetto.dev. Events are kept in memory and written on close().
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.enabled = path is not None
+        self.lock = threading.Lock()
+        self.events = []
+        self.threads = set()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return self.record(name, args)
+
+    @contextmanager
+    def record(self, name, args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            thread = threading.current_thread()
+            event = {'name': name, 'ph': 'X', 'pid': self.pid, 'tid': thread.ident,
+                     'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6}
+            if args:
+                event['args'] = {k: str(v) for k, v in args.items()}
+            with self.lock:
+                if thread.ident not in self.threads:
+                    self.threads.add(thread.ident)
+                    self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': thread.ident,
+                                        'args': {'name': thread.name}})
+                self.events.append(event)
+
+    def close(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            events = list(self.events)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        os.replace(tmp, self.path)
+        print(f"Trace with {len(events)} events written to {self.path}")
+
+
+def tracer_from_env(directory):
+    """SPAN_TRACER writing <directory>/trace.json when CMF_TRACE is set, else a disabled one"""
+    if os.environ.get('CMF_TRACE', '').strip().lower() in ('', '0', 'no', 'false'):
+        return SPAN_TRACER()
+    return SPAN_TRACER(os.path.join(directory, 'trace.json'))